@@ -1,17 +1,27 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import seaborn as sns
-import plotly.express as px
-from sklearn.preprocessing import StandardScaler
-import joblib
 import os
-import pdf_generator as pg
+import tempfile
+import uuid
+# pdf_generator (fpdf, Kaleido) et entrainement (scikit-learn) ne sont importés qu'à leur première utilisation
+from cache_partage import CachePartage
+from data_loader import CacheFichiers, cle_nettoyage, fusionner_donnees
+from dataset_store import actualiser_fichier, charger_store, signature_store, store_existe
+from file_rapports import FileRapports
+from instrumentation import Journal, activer, mesurer
+from pipeline import (PROFILS_EMOTIONS, SEUIL_AGREGATION, anonymiser, anonymiser_noms, appliquer_clustering,
+                      charger_modele, dernier_modele, figure_clusters, figure_comparaison, figure_notes,
+                      figure_reussite, generer_rapports_etudiants, get_top_students, grand_jeu, index_etudiants,
+                      index_filieres, metadonnees_modele, moyennes_partielles, moyennes_selection,
+                      partiels_clusters, positions_selection, profil_clusters, profil_selection)
 
 # Configuration de la page Streamlit
 st.set_page_config(page_title="Émotionnella", layout="wide")
 st.title("Émotionnella - Analyse des Émotions Étudiantes")
 
+# Mesures de performance de cette exécution du script (panneau administrateur)
+journal = activer(Journal())
+
 # Initialisation des variables de session si nécessaire
 if 'admin_auth' not in st.session_state:
     st.session_state.admin_auth = False
@@ -21,11 +31,12 @@ if 'show_password' not in st.session_state:
 # --- Chargement du modèle de clustering ---
 @st.cache_resource
 def load_model():
-    return joblib.load("clustering_model.pkl")
+    # Dernière version réentraînée (clustering_model.vNNNN.pkl) ou modèle d'origine, avec
+    # les métadonnées des clusters (émotion, caractéristique) calculées une seule fois
+    chemin = dernier_modele()
+    model, scaler = charger_modele(chemin)
+    return chemin, model, scaler, metadonnees_modele(model, scaler)
 
-model_dict = load_model()
-model = model_dict["kmeans"]
-scaler = model_dict.get("scaler", StandardScaler())
 
 # --- Authentification Admin ---
 def gestion_auth_admin():
@@ -76,108 +87,24 @@ st.sidebar.header("Paramètres de données")
 source = st.sidebar.radio("Source des données", ["Fichiers internes", "Téléverser un fichier"])
 
 # --- Chargement et nettoyage des données ---
-@st.cache_data
-def load_default_data():
-    return pd.read_excel("donnees_etudiants.xlsx")
+@st.cache_resource
+def get_cache_partage():
+    # Jeux de données et agrégats communs à toutes les sessions, dans un budget mémoire
+    # (EMOTIONNELLA_BUDGET_CACHE_MO) : une seule copie d'un même jeu pour tous les enseignants
+    return CachePartage()
 
-def convert_time(time_str):
-    if pd.isna(time_str) or time_str == "-":
-        return np.nan
-    
-    # Convertir en string si ce n'est pas déjà le cas
-    if not isinstance(time_str, str):
-        return float(time_str)
-    
-    # Cas 1: Format "X heures Y min"
-    if 'heures' in time_str:
-        parts = time_str.split('heures')
-        heures = float(parts[0].strip())
-        reste = parts[1].strip()
-        
-        if 'min' in reste:
-            mins = float(reste.split('min')[0].strip())
-        else:
-            mins = 0
-        return heures * 60 + mins
-    
-    # Cas 2: Format "X min Y s" 
-    elif 'min' in time_str:
-        parts = time_str.split('min')
-        mins = float(parts[0].strip())
-        secs = float(parts[1].replace('s', '').strip()) if 's' in parts[1] else 0
-        return mins + secs / 60
-    
-    # Cas 3: Format "X s" 
-    elif 's' in time_str:
-        return float(time_str.replace('s', '').strip()) / 60
-    
-    # Si aucun format reconnu
-    else:
-        try:
-            return float(time_str) 
-        except:
-            return np.nan
-
-@st.cache_data
-def nettoyer_donnees(df):    
-    # 1. Création du Nom Complet
-    if 'Prénom' in df.columns and 'Nom' in df.columns and 'Nom Complet' not in df.columns:
-        df['Nom Complet'] = df['Prénom'] + ' ' + df['Nom']
-    
-    # 2. Identification des colonnes de questions avec format standard
-    question_cols = [col for col in df.columns if col.startswith('Q.') and '/1,00' in col]
-    
-    if not question_cols:
-        question_cols = [col for col in df.columns if col.startswith('Q.')]
-    
-    # 3. Traitement des colonnes numériques (questions et note finale)
-    important_numcols = ['Note/20,00']
-    if question_cols:
-        for col in question_cols + important_numcols:
-            if col in df.columns:
-                # Remplacer tirets, virgules et convertir en float
-                df[col] = df[col].replace("-", np.nan)
-                if df[col].dtype == object:
-                    df[col] = df[col].str.replace(',', '.', regex=False).astype(float)
-        
-        # Supprimer les lignes où la note finale est NaN
-        if 'Note/20,00' in df.columns:
-            df = df.dropna(subset=['Note/20,00'])
-        
-        # Remplire les NaN des questions par 0
-        df[question_cols] = df[question_cols].fillna(0)
-    
-    # 4. Traitement du temps
-    if 'Temps utilisé' in df.columns and 'Temps utilisé (min)' not in df.columns:
-        df['Temps utilisé (min)'] = df['Temps utilisé'].apply(convert_time)
-        df = df.drop('Temps utilisé', axis=1)
-    
-    # 5. Limitation du temps autorisé à 35 minutes
-    if 'Temps utilisé (min)' in df.columns:
-        df = df[df['Temps utilisé (min)'] < 20]
-    
-    # 6. Normalisation des noms de colonnes pour les questions
-    rename_dict = {}
-    for col in question_cols:
-        if '/1,00' in col:
-            new_name = col.split('/')[0].strip()
-            rename_dict[col] = new_name
-    
-    if rename_dict:
-        df = df.rename(columns=rename_dict)
-    
-    # 7. Réorganisation et sélection des colonnes importantes
-    important_cols = ['Nom Complet', 'Filière', 'Temps utilisé (min)', 'Note/20,00']
-    # Mise à jour des colonnes de questions après renommage
-    question_cols = [col for col in df.columns if col.startswith('Q.')]
-    
-    # Conserver uniquement les colonnes importantes qui existent
-    cols_to_keep = [col for col in important_cols if col in df.columns] + question_cols
-    
-    if cols_to_keep:
-        df = df[cols_to_keep]
+cache_partage = get_cache_partage()
 
-    return df.dropna().drop_duplicates()
+def load_default_data():
+    # Store Parquet typé (python dataset_store.py import ...), créé au premier lancement
+    if not store_existe():
+        return pd.read_excel("donnees_etudiants.xlsx")
+    return charger_store()
+
+@st.cache_resource
+def get_cache_fichiers():
+    # Cache partagé des fichiers téléversés (disque optionnel via EMOTIONNELLA_CACHE_DIR)
+    return CacheFichiers(taille_max=64, dossier=os.environ.get("EMOTIONNELLA_CACHE_DIR"), cache=cache_partage)
 
 if source == "Téléverser un fichier":
     uploaded_files = st.file_uploader("Choisissez un ou plusieurs fichiers .xlsx ou .csv", 
@@ -187,154 +114,143 @@ if source == "Téléverser un fichier":
         # Traitement s'il y a plusieurs fichiers
         if len(uploaded_files) > 1:
             st.info(f"{len(uploaded_files)} fichiers téléversés. Fusion en cours...")
-            
-            df_list = []
-            for file in uploaded_files:
-                try:
-                    # Déterminer le format du fichier
-                    if file.name.endswith(".csv"):
-                        temp_df = pd.read_csv(file)
-                    else:
-                        temp_df = pd.read_excel(file)
-                    
-                    # Supprimer la dernière ligne si c'est une moyenne
-                    if "Moyenne" in str(temp_df.iloc[-1].values):
-                        temp_df = temp_df.iloc[:-1]
-                        
-                    # Extraire la filière du nom de fichier
-                    import re
-                    filiere_match = re.search(r'MTU\s+(\w+)', file.name)
-                    if filiere_match:
-                        filiere = filiere_match.group(1)
-                    else:
-                        # Fallback si le pattern ne correspond pas
-                        if "-" in file.name:
-                            filiere = file.name.split("-")[0].strip()
-                        else:
-                            filiere = file.name.split(".")[0].strip()
-                    
-                    # Créer la colonne filière 
-                    if "Filière" not in temp_df.columns:
-                        temp_df["Filière"] = filiere
-                    
-                    df_list.append(temp_df)
-                    
-                except Exception as e:
-                    st.error(f"Erreur lors du traitement du fichier {file.name}: {str(e)}")
-            
-            # Fusionner tous les fichiers
-            if df_list:
-                df = pd.concat(df_list, ignore_index=True)
-                # Nettoyer les données
-                df = nettoyer_donnees(df)
+
+        # Jeu fusionné déjà en cache (même contenu téléversé, quelle que soit la session)
+        cle_donnees = ("televersement",) + tuple(cle_nettoyage(file.getvalue(), file.name)
+                                                 for file in uploaded_files)
+        df = cache_partage.lire(cle_donnees)
+    if uploaded_files and df is None:
+        # Lecture et nettoyage en parallèle, ignorés si le contenu est déjà en cache
+        with mesurer("lecture_nettoyage") as mesure:
+            resultats = get_cache_fichiers().charger_plusieurs(
+                [(file.getvalue(), file.name) for file in uploaded_files])
+            mesure["lignes"] = sum(len(temp_df) for temp_df, erreur in resultats if erreur is None)
+        df_list = []
+        for file, (temp_df, erreur) in zip(uploaded_files, resultats):
+            if erreur is not None:
+                st.error(f"Erreur lors du traitement du fichier {file.name}: {str(erreur)}")
             else:
-                st.error("Aucun fichier n'a pu être traité correctement.")
-                st.stop()
-            
-        else: 
-            file = uploaded_files[0]
-            try:
-                if file.name.endswith(".csv"):
-                    df = pd.read_csv(file)
-                else:
-                    df = pd.read_excel(file)
-                
-                # Supprimer la dernière ligne si c'est une moyenne
-                if "Moyenne" in str(df.iloc[-1].values):
-                    df = df.iloc[:-1]
-                    
-                # Extraire la filière du nom de fichier
-                import re
-                filiere_match = re.search(r'MTU\s+(\w+)', file.name)
-                if filiere_match:
-                    filiere = filiere_match.group(1)
-                else:
-                    # Fallback si le pattern ne correspond pas
-                    if "-" in file.name:
-                        filiere = file.name.split("-")[0].strip()
-                    else:
-                        filiere = file.name.split(".")[0].strip()
-                
-                # Créer la colonne filière 
-                if "Filière" not in df.columns:
-                    df["Filière"] = filiere
-                
-                # Nettoyer les données
-                df = nettoyer_donnees(df)
-                
-            except Exception as e:
-                st.error(f"Erreur lors du traitement du fichier {file.name}: {str(e)}")
-                st.stop()
-    else:
+                df_list.append(temp_df)
+        
+        # Fusionner tous les fichiers
+        if df_list:
+            with mesurer("fusion") as mesure:
+                df = fusionner_donnees(df_list)
+                mesure["lignes"] = len(df)
+            # Gardé seulement si tous les fichiers sont lisibles : les erreurs restent affichées
+            if len(df_list) == len(uploaded_files):
+                df = cache_partage.ajouter(cle_donnees, df)
+        else:
+            st.error("Aucun fichier n'a pu être traité correctement.")
+            st.stop()
+    elif not uploaded_files:
         st.warning("Veuillez téléverser un fichier pour continuer.")
         st.stop()
 else:
-    df = load_default_data()
+    with mesurer("chargement") as mesure:
+        # Store créé à partir de donnees_etudiants.xlsx au premier lancement, et réimporté s'il a
+        # changé depuis (sauf store constitué d'autres exports) ; le jeu est rechargé après
+        # chaque import dans le store
+        try:
+            actualiser_fichier("donnees_etudiants.xlsx", deja_nettoye=True, si_importe=store_existe())
+        except OSError:
+            # Store non inscriptible : lecture directe du fichier par load_default_data
+            pass
+        cle_donnees = ("defaut", signature_store())
+        df = cache_partage.obtenir(cle_donnees, load_default_data)
+        mesure["lignes"] = len(df)
+
+# --- Réentraînement du modèle (administrateur) ---
+if admin_mode:
+    with st.sidebar.expander("Entraînement du modèle"):
+        st.caption(f"Modèle actif : {os.path.basename(dernier_modele())}")
+        if source == "Téléverser un fichier":
+            if st.button("Mettre à jour le modèle avec ces données"):
+                from entrainement import entrainer, lots_depuis_df
+                nouveau, vus = entrainer(lots_depuis_df(df))
+                if nouveau is None:
+                    st.warning("Aucune donnée exploitable pour l'entraînement.")
+                else:
+                    st.success(f"{vus} étudiants appris : {os.path.basename(nouveau)}")
+                    load_model.clear()
+                    st.rerun()
+        else:
+            st.caption("Téléversez de nouveaux fichiers pour mettre à jour le modèle.")
 
 # --- Anonymisation des noms ---
-def anonymiser_nom(nom_complet):
-    parts = nom_complet.split()
-    if len(parts) >= 2:
-        return f"{parts[0]} {parts[1][0]}."
-    return nom_complet
-
+# Les résultats dérivés du jeu de données sont en cache sous cle_donnees + vue (noms anonymisés ou non)
+vue_donnees = "administrateur" if admin_mode else "anonyme"
 if not admin_mode and "Nom Complet" in df.columns:
-    df["Nom Complet"] = df["Nom Complet"].apply(anonymiser_nom)
+    # Vue anonymisée : df garde les noms identifiables, les autres colonnes sont partagées.
+    # Noms calculés une fois par jeu de données, quel que soit le mode (🔒/🔓)
+    with mesurer("anonymisation", lignes=len(df)):
+        df = anonymiser(df, cache_partage.obtenir(cle_donnees + ("noms_anonymes",), anonymiser_noms,
+                                                  df["Nom Complet"]))
 
 # --- Filtrage par filière ---
+def preparer_filieres(df):
+    # Lignes et agrégats partiels de chaque filière, et leur top 5, une fois par jeu de données :
+    # changer la sélection ne fait que combiner ces résultats
+    return index_filieres(df), get_top_students(df, n=5)
+
+df_complet = df
+index_df = lignes_filieres = None
 if "Filière" in df.columns:
-    filieres = df["Filière"].unique().tolist()
-    filieres_selectionnees = st.multiselect("Choisissez les filières à analyser", filieres, default=filieres)
-    df = df[df["Filière"].isin(filieres_selectionnees)]
+    with mesurer("index_filieres", lignes=len(df)):
+        index_df, top_filieres = cache_partage.obtenir(cle_donnees + (vue_donnees, "filieres"),
+                                                       preparer_filieres, df)
+    filieres_selectionnees = st.multiselect("Choisissez les filières à analyser", index_df["filieres"],
+                                            default=index_df["filieres"])
+    with mesurer("filtrage") as mesure:
+        # Même résultat que df[df["Filière"].isin(...)] ; None : toutes les filières, df inchangé
+        lignes_filieres = positions_selection(index_df, filieres_selectionnees)
+        if lignes_filieres is not None:
+            df = df.take(lignes_filieres)
+        mesure["lignes"] = len(df)
 
 # --- Aperçu ---
 st.subheader("Aperçu des données")
-st.dataframe(df)
+if grand_jeu(df):
+    # Grand jeu de données : seule la page affichée est envoyée au navigateur
+    lignes_par_page = 1000
+    nb_pages = (len(df) - 1) // lignes_par_page + 1
+    page = st.number_input(f"Page (sur {nb_pages})", min_value=1, max_value=nb_pages, value=1, step=1)
+    debut = (page - 1) * lignes_par_page
+    st.dataframe(df.iloc[debut:debut + lignes_par_page])
+    st.caption(f"Lignes {debut + 1} à {min(debut + lignes_par_page, len(df))} sur {len(df)} "
+               f"(graphiques agrégés au-delà de {SEUIL_AGREGATION} lignes)")
+else:
+    st.dataframe(df)
 
 # --- Graphiques ---
 question_cols = [col for col in df.columns if col.startswith("Q.")]
 
 # Boxplot de la note par filière
 st.subheader("Distribution des Notes par Filière")
-fig1 = px.box(df, x="Filière", y="Note/20,00", color="Filière")
-st.plotly_chart(fig1, use_container_width=True, key="box_plot") 
+with mesurer("graphiques.notes", lignes=len(df)):
+    fig1 = figure_notes(df)
+    st.plotly_chart(fig1, use_container_width=True, key="box_plot")
 
 # Bar chart du taux de réussite par question
 st.subheader("Taux de Réussite par Question")
-taux_reussite = df[question_cols].mean() * 100
-taux_df = taux_reussite.reset_index()
-taux_df.columns = ["Question", "Taux de Réussite (%)"]
-
-fig2 = px.bar(
-    taux_df,
-    x="Question",
-    y="Taux de Réussite (%)",
-    color="Taux de Réussite (%)",
-    color_continuous_scale="Blues"
-)
-st.plotly_chart(fig2, use_container_width=True, key="bar_plot")
+with mesurer("graphiques.reussite", lignes=len(df)):
+    moyennes_questions = None
+    if index_df is not None:
+        moyennes_questions = moyennes_selection(index_df, filieres_selectionnees, question_cols)
+    fig2 = figure_reussite(df, question_cols, moyennes_questions)
+    st.plotly_chart(fig2, use_container_width=True, key="bar_plot")
 
 # --- Top 5 Étudiants par Filière ---
 st.subheader("Top 5 des Étudiants par Filière")
 
-# Fonction pour obtenir les 5 meilleurs étudiants par filière
-def get_top_students(dataframe, n=5):
-    # Grouper par filière et trier par note dans chaque groupe
-    top_students_dict = {}
-    
-    for filiere in dataframe["Filière"].unique():
-        # Filtrer par filière
-        filiere_df = dataframe[dataframe["Filière"] == filiere]
-        # Trier par note décroissante
-        filiere_df = filiere_df.sort_values(by="Note/20,00", ascending=False)
-        # Prendre les n premiers
-        top_n = filiere_df.head(n)
-        top_students_dict[filiere] = top_n
-    
-    return top_students_dict
-
 # Obtenir les top 5 étudiants par filière
-top_students_dict = get_top_students(df, n=5)
+with mesurer("top", lignes=len(df)):
+    if index_df is not None:
+        # Le top 5 d'une filière ne dépend pas des autres : lu dans les tops précalculés
+        selection = set(filieres_selectionnees)
+        top_students_dict = {filiere: top for filiere, top in top_filieres.items() if filiere in selection}
+    else:
+        top_students_dict = get_top_students(df, n=5)
 
 # Afficher les top 5 pour chaque filière dans des onglets
 tabs = st.tabs(list(top_students_dict.keys()))
@@ -370,94 +286,131 @@ for i, (filiere, students_df) in enumerate(top_students_dict.items()):
             st.info(f"Aucun étudiant trouvé pour la filière {filiere}")
 
 # --- Clustering ---
-st.subheader("Clustering des Étudiants avec KMeans (4 groupes)")
+def preparer_clusters(df, chemin_modele, index_df):
+    # Clusters de toutes les lignes et leurs partiels par filière × cluster
+    model, scaler = charger_modele(chemin_modele)
+    return partiels_clusters(df, index_df, model, scaler)
+
+# Le modèle n'est chargé (joblib, scikit-learn) qu'une fois les premières sections affichées
+with mesurer("modele"):
+    chemin_modele, model, scaler, meta_modele = load_model()
+st.subheader(f"Clustering des Étudiants avec KMeans ({meta_modele['n_clusters']} groupes)")
 if "Temps utilisé (min)" in df.columns and "Note/20,00" in df.columns:
-    X = df[["Temps utilisé (min)", "Note/20,00"]].values
-    X_scaled = scaler.transform(X)
-    labels = model.predict(X_scaled)
-    df["Cluster"] = labels + 1
-
-    # Mappage des clusters aux émotions
-    legendes_emotions = {
-        1: "Confiant(e) mais prenant son temps", 
-        2: "Stressé(e)",  
-        3: "Frustré(e) ou abandonné(e)",  
-        4: "Confiant(e) rapide"
-    }
-    
-    df["Émotion"] = df["Cluster"].map(legendes_emotions)
-    
-    # Mappage des couleurs selon l'émotion du cluster
-    cluster_colors = {
-        "Confiant(e) mais prenant son temps": "#FFABAB",  # Rose clair
-        "Stressé(e)": "#83C9FF",  # Bleu clair
-        "Frustré(e) ou abandonné(e)": "#0068C9",  # Bleu foncé
-        "Confiant(e) rapide": "#FF2B2B"  # Rouge vif
-    }
+    with mesurer("clustering", lignes=len(df)):
+        partiels = None
+        if index_df is not None:
+            # Toutes les lignes prédites une fois par jeu de données, puis réparties par filière
+            partiels = cache_partage.obtenir(cle_donnees + (chemin_modele, "clusters"), preparer_clusters,
+                                             df_complet, chemin_modele, index_df)
+            clusters = partiels["clusters"] if lignes_filieres is None else partiels["clusters"][lignes_filieres]
+            df = appliquer_clustering(df, model, scaler, clusters=clusters)
+        else:
+            df = appliquer_clustering(df, model, scaler)
 
     # Création du graphique
-    fig3 = px.scatter(df, x="Temps utilisé (min)", y="Note/20,00", color="Émotion", symbol="Filière",
-                      title="Clustering des Étudiants selon l'Émotion", hover_data=["Nom Complet"],
-                      color_discrete_map=cluster_colors)
-
-    st.plotly_chart(fig3)
+    with mesurer("graphiques.clusters", lignes=len(df)):
+        fig3 = figure_clusters(df)
+        st.plotly_chart(fig3)
 
     # Créer un tableau de résumé pour les clusters
     df = df.reset_index(drop=True)
-    profil_clusters = []
-
-    for cluster in sorted(df['Cluster'].unique()):
-        cluster_data = df[df['Cluster'] == cluster]
-        nb_etudiants = len(cluster_data)
-        note_moy = cluster_data['Note/20,00'].mean()
-        temps_moy = cluster_data['Temps utilisé (min)'].mean()
-
-        if note_moy > 15:
-            caractere = "✓ Hautes notes avec temps modéré"
-        elif note_moy < 5:
-            caractere = "⨻ Basses notes avec temps court"
+    with mesurer("profil", lignes=len(df)):
+        if partiels is not None:
+            profil_df = profil_selection(partiels, index_df, filieres_selectionnees, meta_modele)
         else:
-            caractere = "– Notes moyennes avec temps variable"
-
-        profil_clusters.append({
-            "Nom du groupe": f"{legendes_emotions[cluster]}",
-            "Nombre d'étudiants": nb_etudiants,
-            "Note moyenne": round(note_moy, 2),
-            "Temps moyen (min)": round(temps_moy, 2),
-            "Caractéristique principale": caractere
-        })
-
-    # Convertir en DataFrame
-    profil_df = pd.DataFrame(profil_clusters)
+            profil_df = profil_clusters(df, meta_modele)
 
     # Afficher dans Streamlit
     st.subheader("Profil des Clusters")
     st.table(profil_df)
 
 # --- Générer le PDF ---
+@st.cache_resource
+def get_file_rapports():
+    # File partagée par toutes les sessions : un rapport identique n'est généré qu'une fois
+    return FileRapports()
+
 st.subheader("Le Rapport PDF")
+# Contenu du rapport de cette page : données, vue, filières et modèle
+cle_page = cle_donnees + (vue_donnees, tuple(filieres_selectionnees) if index_df is not None else None,
+                          locals().get("chemin_modele"))
+if st.session_state.get("rapport_page") != cle_page:
+    # Données ou sélection changées : le rapport demandé ne correspond plus à la page
+    st.session_state.pop("rapport_pdf", None)
+
 if st.button("Générer le PDF du Rapport"):
-    # Vérifier si fig3 et profil_df existent
-    if 'fig3' in locals() and 'profil_df' in locals():
-        pdf_path = pg.generer_pdf(df, fig1, fig2, fig3=fig3, profil_df=profil_df, top_students_dict=top_students_dict)
-    else:
-        pdf_path = pg.generer_pdf(df, fig1, fig2, top_students_dict=top_students_dict)
-        
-    with open(pdf_path, "rb") as f:
-        st.download_button("Télécharger le Rapport PDF", f, file_name="rapport_emotionnella.pdf")
-    os.remove(pdf_path)
+    # Génération en arrière-plan : l'application reste utilisable pendant le rendu
+    with mesurer("pdf", lignes=len(df)):
+        # Vérifier si fig3 et profil_df existent
+        if 'fig3' in locals() and 'profil_df' in locals():
+            st.session_state.rapport_pdf = get_file_rapports().soumettre_rapport(
+                df, fig1, fig2, fig3=fig3, profil_df=profil_df, top_students_dict=top_students_dict)
+        else:
+            st.session_state.rapport_pdf = get_file_rapports().soumettre_rapport(
+                df, fig1, fig2, top_students_dict=top_students_dict)
+        st.session_state.rapport_page = cle_page
+
+if st.session_state.get("rapport_pdf"):
+    etat_rapport = get_file_rapports().etat(st.session_state.rapport_pdf)
+    en_cours = etat_rapport is not None and etat_rapport["statut"] in ("en_attente", "en_cours")
+    if (etat_rapport is not None and etat_rapport["etapes"]
+            and st.session_state.get("rapport_mesure") != st.session_state.rapport_pdf):
+        # Génération terminée en arrière-plan : ses étapes sont ajoutées une fois au journal
+        journal.importer(etat_rapport["etapes"])
+        st.session_state.rapport_mesure = st.session_state.rapport_pdf
+
+    # Seul ce bloc est réexécuté chaque seconde tant que le rapport est en préparation
+    @st.fragment(run_every=1.0 if en_cours else None)
+    def suivi_rapport():
+        etat = get_file_rapports().etat(st.session_state.rapport_pdf)
+        if etat is None:
+            st.warning("Ce rapport n'est plus disponible, relancez la génération.")
+        elif etat["statut"] == "erreur":
+            st.error(f"Erreur lors de la génération du rapport : {etat['erreur']}")
+        elif etat["statut"] != "termine":
+            st.progress(etat["progression"],
+                        text=f"Rapport n° {st.session_state.rapport_pdf[:8]} en préparation...")
+        elif en_cours:
+            # Terminé pendant le suivi : réexécution complète, qui arrête le rafraîchissement
+            st.rerun()
+        else:
+            pdf = get_file_rapports().lire(st.session_state.rapport_pdf)
+            if pdf is not None:
+                st.download_button("Télécharger le Rapport PDF", pdf, file_name="rapport_emotionnella.pdf")
+
+    suivi_rapport()
 
 # --- section pour visualiser un étudiant spécifique ---
+def preparer_comparaison(df):
+    # Index des étudiants, recalculé seulement si les données ou la sélection changent
+    positions = index_etudiants(df)
+    return positions, sorted(positions)
+
+# Encadré utilisé pour chaque émotion
+STYLES_EMOTIONS = {
+    "Confiant(e) rapide": st.success,
+    "Confiant(e) mais prenant son temps": st.info,
+    "Stressé(e)": st.warning,
+    "Frustré(e) ou abandonné(e)": st.error,
+}
+
 st.subheader("Analyse des Émotions d'un Étudiant Spécifique")
 
 # Déterminer s'il y a des étudiants à analyser
 if len(df) > 0 and "Nom Complet" in df.columns:
     # Créer un sélecteur pour choisir un étudiant
-    etudiants = sorted(df["Nom Complet"].unique().tolist())
+    with mesurer("comparaison", lignes=len(df)):
+        selection_cle = tuple(filieres_selectionnees) if index_df is not None else None
+        positions, etudiants = cache_partage.obtenir(cle_donnees + (vue_donnees, selection_cle, "etudiants"),
+                                                     preparer_comparaison, df)
+        # Matrice filière × question, lue dans les sommes partielles
+        moyennes_filieres = None
+        if index_df is not None:
+            moyennes_filieres = moyennes_partielles(index_df, [col for col in df.columns if col.startswith("Q.")])
     etudiant_selectionne = st.selectbox("Sélectionnez un étudiant", etudiants)
     
-    # Récupérer les données de l'étudiant sélectionné
-    etudiant_data = df[df["Nom Complet"] == etudiant_selectionne].iloc[0]
+    # Récupérer les données de l'étudiant sélectionné (accès direct par position)
+    etudiant_data = df.iloc[positions[etudiant_selectionne]]
     
     # Créer un affichage en colonnes pour les informations clés
     col1, col2, col3 = st.columns(3)
@@ -501,23 +454,12 @@ if len(df) > 0 and "Nom Complet" in df.columns:
         # Comparer avec la moyenne de la filière
         if "Filière" in etudiant_data:
             filiere = etudiant_data["Filière"]
-            filiere_avg = df[df["Filière"] == filiere][question_cols].mean()
-                        
-            # Créer un DataFrame pour la comparaison
-            compare_data = []
-            for q in question_cols:
-                compare_data.append({
-                    "Question": q,
-                    "Score Étudiant": etudiant_data[q],
-                    "Moyenne Filière": filiere_avg[q]
-                })
-            
-            compare_df = pd.DataFrame(compare_data)
-            
+            filiere_avg = moyennes_filieres.loc[filiere]
+
             # Créer un graphique à barres pour la comparaison
-            fig_compare = px.bar(compare_df, x="Question", y=["Score Étudiant", "Moyenne Filière"],
-                               barmode="group", title=f"Comparaison {etudiant_selectionne} vs Moyenne {filiere}",
-                               labels={"value": "Score (0 = Faux, 1 = Correct)", "variable": "Type de Score"})
+            fig_compare = figure_comparaison(etudiant_selectionne, filiere,
+                                             [etudiant_data[q] for q in question_cols],
+                                             filiere_avg[question_cols].tolist(), question_cols)
             st.plotly_chart(fig_compare, use_container_width=True)
     
     # Afficher un récapitulatif des performances et des recommandations
@@ -530,64 +472,58 @@ if len(df) > 0 and "Nom Complet" in df.columns:
         
         st.write(f"### Profil de {etudiant_selectionne}")
         
-        if "Confiant(e) rapide" in emotion:
-            st.success(f"""
-            **État émotionnel détecté: Confiant(e) et rapide** 😊
-            
-            Cet étudiant démontre une excellente maîtrise du sujet et une gestion efficace du temps.
-            - Ses performances sont excellentes, avec une note de {note:.2f}/20
-            - Son rythme rapide indique une grande confiance dans ses réponses
-            
-            **Recommandations:**
-            - Continuer à maintenir cette efficacité
-            - Peut être encouragé à approfondir d'autres sujets avancés
-            - Pourrait aider les autres étudiants en difficulté (tutorat)
-            """)
-            
-        elif "Confiant(e) mais prenant son temps" in emotion:
-            st.info(f"""
-            **État émotionnel détecté: Confiant(e) mais prenant son temps** 🙂
-            
-            Cet étudiant montre une bonne maîtrise du sujet mais préfère travailler avec prudence.
-            - Sa note de {note:.2f}/20 reflète une bonne compréhension
-            - Son temps de travail plus long suggère une approche méticuleuse
-            
-            **Recommandations:**
-            - Travailler sur la gestion du temps tout en maintenant la qualité
-            - Exercices avec contraintes de temps pour améliorer la rapidité
-            - Garder confiance dans ses premières réponses
-            """)
-            
-        elif "Stressé(e)" in emotion:
-            st.warning(f"""
-            **État émotionnel détecté: Stressé(e)** 😰
-            
-            Cet étudiant montre des signes de stress pendant l'examen.
-            - Sa note de {note:.2f}/20 pourrait être améliorée
-            - Son temps de réponse et ses résultats suggèrent une anxiété de performance
-            
-            **Recommandations:**
-            - Techniques de gestion du stress (respiration)
-            - Plus d'exercices pratiques dans des conditions d'examen
-            - Établir un plan de révision progressif
-            - Envisager des séances de tutorat ou des sessions de questions-réponses
-            """)
-            
-        elif "Frustré(e)" in emotion:
-            st.error(f"""
-            **État émotionnel détecté: Frustré(e) ou ayant abandonné** 😣
-            
-            Cet étudiant semble avoir rencontré des difficultés importantes pendant l'examen.
-            - Sa note de {note:.2f}/20 indique des lacunes à combler
-            - Son comportement suggère un possible abandon ou une grande frustration
-            
-            **Recommandations:**
-            - Identifier les concepts fondamentaux à réviser
-            - Prévoir des sessions de rattrapage ciblées
-            - Envisager un accompagnement personnalisé
-            - Travailler sur la confiance et la persévérance face aux difficultés
-            """)
+        profil = PROFILS_EMOTIONS.get(emotion)
+        if profil is not None:
+            texte = (f"**État émotionnel détecté: {profil['titre']}** {profil['emoji']}\n\n"
+                     f"{profil['resume']}\n"
+                     + "".join(f"- {constat.format(note=note)}\n" for constat in profil["constats"])
+                     + "\n**Recommandations:**\n"
+                     + "".join(f"- {recommandation}\n" for recommandation in profil["recommandations"]))
+            STYLES_EMOTIONS[emotion](texte)
     else:
         st.write("Analyse émotionnelle non disponible pour cet étudiant.")
+
+    # Rapports individuels de tous les étudiants (ou des filières choisies) dans une archive ZIP
+    st.subheader("Rapports Individuels")
+    filieres_rapports = None
+    if "Filière" in df.columns:
+        filieres_rapports = st.multiselect("Filières concernées", df["Filière"].unique().tolist(),
+                                           default=df["Filière"].unique().tolist(), key="filieres_rapports")
+    if st.button("Générer les rapports individuels (ZIP)"):
+        barre = st.progress(0.0, text="Génération des rapports...")
+        chemin_zip = os.path.join(tempfile.gettempdir(), f"{uuid.uuid4()}.zip")
+        with mesurer("rapports_individuels") as mesure:
+            n = generer_rapports_etudiants(
+                df, chemin_zip, filieres=filieres_rapports,
+                progression=lambda faits, total: barre.progress(faits / total, text=f"{faits}/{total} rapports"))
+            mesure["lignes"] = n
+        barre.empty()
+        with open(chemin_zip, "rb") as f:
+            st.download_button(f"Télécharger les {n} rapports (ZIP)", f, file_name="rapports_etudiants.zip")
+        os.remove(chemin_zip)
 else:
-    st.info("Aucune donnée d'étudiant disponible. Veuillez télécharger un fichier ou sélectionner des filières.")
\ No newline at end of file
+    st.info("Aucune donnée d'étudiant disponible. Veuillez télécharger un fichier ou sélectionner des filières.")
+# --- Mesures de performance (administrateur) ---
+if admin_mode:
+    with st.sidebar.expander("Mesures de performance"):
+        mesures_df = pd.DataFrame(journal.etapes, columns=["etape", "niveau", "duree", "lignes", "memoire"])
+        mesures_df = pd.DataFrame({
+            # Sous-étapes (ex. pdf.rasterisation) marquées sous leur étape
+            "Étape": mesures_df["etape"].where(mesures_df["niveau"] == 0, "↳ " + mesures_df["etape"]),
+            "Durée (ms)": (mesures_df["duree"] * 1000).round(1),
+            "Lignes": mesures_df["lignes"].astype("Int64"),
+            "Mémoire (Mo)": (mesures_df["memoire"].astype(float) / 1024 ** 2).round(1),
+        })
+        st.dataframe(mesures_df, hide_index=True)
+        st.caption(f"Total mesuré : {journal.total():.2f} s")
+        stats_cache = cache_partage.statistiques()
+        st.caption(f"Cache partagé : {stats_cache['entrees']} entrées, {stats_cache['taille_mo']:.0f} Mo "
+                   f"sur {stats_cache['budget_mo']:.0f} Mo, {stats_cache['succes']} succès, "
+                   f"{stats_cache['echecs']} échecs, {stats_cache['evictions']} évictions")
+        st.download_button("Exporter en JSON", journal.vers_json(), file_name="mesures_emotionnella.json",
+                           mime="application/json")
+        st.download_button("Exporter au format Prometheus", journal.vers_prometheus() + cache_partage.vers_prometheus(),
+                           file_name="mesures_emotionnella.prom", mime="text/plain")
+        if st.button("Vider le cache partagé"):
+            cache_partage.vider()
+            st.rerun()
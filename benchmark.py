@@ -0,0 +1,591 @@
+import argparse
+import ast
+import io
+import json
+import multiprocessing
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from cache_partage import CachePartage
+from data_cleaning import convert_time
+from data_cleaning import convertir_temps, nettoyer_donnees, typer_donnees
+from data_loader import fusionner_donnees, lire_fichier, nettoyer_csv_par_morceaux, traiter_fichier, traiter_fichiers
+import pdf_generator as pg
+from pipeline import (LEGENDES_EMOTIONS, appliquer_clustering, charger_modele, figure_clusters, figure_notes,
+                      figure_reussite, generer_rapports_etudiants, get_top_students, index_filieres,
+                      metadonnees_modele, moyennes_selection, partiels_clusters, positions_selection,
+                      profil_clusters, profil_selection)
+
+# --- Outils de mesure ---
+def chronometrer(fonction, *args, repetitions=3, **kwargs):
+    # Renvoie le meilleur temps (s) et le résultat du dernier appel
+    meilleur = float("inf")
+    resultat = None
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        resultat = fonction(*args, **kwargs)
+        meilleur = min(meilleur, time.perf_counter() - debut)
+    return meilleur, resultat
+
+def generer_temps(n, seed=0):
+    # Durées au format Moodle, avec quelques tirets
+    rng = np.random.default_rng(seed)
+    mins = rng.integers(0, 60, n)
+    secs = rng.integers(0, 60, n)
+    formats = rng.integers(0, 4, n)
+    valeurs = np.where(formats == 0, [f"{m // 30} heures {m} min" for m in mins],
+              np.where(formats == 1, [f"{m} min {s} s" for m, s in zip(mins, secs)],
+              np.where(formats == 2, [f"{s} s" for s in secs], "-")))
+    return pd.Series(valeurs, dtype=object)
+
+def generer_export(lignes, questions=20, seed=0, question_vide=False):
+    # Export Moodle synthétique : Prénom/Nom, durées texte, notes à virgule, "-" et ligne Moyenne.
+    # question_vide : une question de plus à laquelle personne n'a répondu (cellules vides)
+    rng = np.random.default_rng(seed)
+    colonnes = {
+        "Nom": [f"Nom{i}" for i in range(lignes)],
+        "Prénom": [f"Prenom{i}" for i in range(lignes)],
+        "Temps utilisé": generer_temps(lignes, seed).to_numpy(),
+        "Note/20,00": pd.Series(rng.uniform(0, 20, lignes).round(2)).astype(str).str.replace(".", ",").to_numpy(),
+    }
+    for q in range(1, questions + 1):
+        reponses = np.where(rng.random(lignes) < 0.5, "1,00", "0,00")
+        colonnes[f"Q. {q} /1,00"] = np.where(rng.random(lignes) < 0.05, "-", reponses)
+    if question_vide:
+        colonnes[f"Q. {questions + 1} /1,00"] = np.full(lignes, None)
+    df = pd.DataFrame(colonnes)
+    moyenne = pd.DataFrame([{"Nom": "Moyenne générale"}])
+    return pd.concat([df, moyenne], ignore_index=True)
+
+def mesurer_memoire(fonction, *args, **kwargs):
+    # Renvoie le temps (s), le pic d'allocation Python/NumPy (Mo) et le résultat
+    tracemalloc.start()
+    debut = time.perf_counter()
+    resultat = fonction(*args, **kwargs)
+    duree = time.perf_counter() - debut
+    _, pic = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duree, pic / 1024 ** 2, resultat
+
+# --- Benchmarks ---
+def bench_temps(args):
+    serie = generer_temps(args.lignes)
+    t_apply, attendu = chronometrer(serie.apply, convert_time, repetitions=1)
+    t_vect, obtenu = chronometrer(convertir_temps, serie)
+
+    # Vérification d'équivalence avec l'ancienne fonction
+    pd.testing.assert_series_equal(obtenu, attendu.astype(float), check_names=False)
+
+    print(f"convert_time (.apply) : {t_apply:.3f} s")
+    print(f"convertir_temps       : {t_vect:.3f} s  (x{t_apply / t_vect:.1f})")
+
+def bench_ingestion(args):
+    # Plusieurs exports .xlsx, lus en séquentiel puis avec le pool de processus
+    fichiers = []
+    for i in range(args.fichiers):
+        tampon = io.BytesIO()
+        generer_export(args.lignes, seed=i).to_excel(tampon, index=False)
+        fichiers.append((tampon.getvalue(), f"Quiz MTU F{i}-export.xlsx"))
+
+    t_seq, _ = chronometrer(traiter_fichiers, fichiers, workers=1, repetitions=1)
+    t_par, _ = chronometrer(traiter_fichiers, fichiers, workers=args.workers, repetitions=1)
+    print(f"{args.fichiers} fichiers x {args.lignes} lignes")
+    print(f"séquentiel         : {t_seq:.3f} s")
+    print(f"parallèle ({args.workers or 'auto'} proc.) : {t_par:.3f} s  (x{t_seq / t_par:.1f})")
+
+def bench_streaming(args):
+    # Gros CSV : lecture complète puis nettoyage, contre lecture par morceaux
+    tampon = io.BytesIO()
+    generer_export(args.lignes, args.questions).to_csv(tampon, index=False)
+    contenu = tampon.getvalue()
+    nom = "Quiz MTU BCG-export.csv"
+
+    t_complet, pic_complet, attendu = mesurer_memoire(
+        lambda: nettoyer_donnees(lire_fichier(contenu, nom)).reset_index(drop=True))
+    t_flux, pic_flux, obtenu = mesurer_memoire(nettoyer_csv_par_morceaux, contenu, nom)
+    pd.testing.assert_frame_equal(typer_donnees(attendu), obtenu)
+
+    print(f"CSV de {len(contenu) / 1024 ** 2:.0f} Mo ({args.lignes} lignes, {args.questions} questions)")
+    print(f"lecture complète : {t_complet:.2f} s, pic {pic_complet:.0f} Mo")
+    print(f"par morceaux     : {t_flux:.2f} s, pic {pic_flux:.0f} Mo")
+
+def _nettoyer_donnees_ancien(df):
+    # Ancienne version de nettoyer_donnees : une conversion et une copie par étape
+    if 'Prénom' in df.columns and 'Nom' in df.columns and 'Nom Complet' not in df.columns:
+        df['Nom Complet'] = df['Prénom'] + ' ' + df['Nom']
+    question_cols = [col for col in df.columns if col.startswith('Q.') and '/1,00' in col]
+    if not question_cols:
+        question_cols = [col for col in df.columns if col.startswith('Q.')]
+    if question_cols:
+        for col in question_cols + ['Note/20,00']:
+            if col in df.columns:
+                df[col] = df[col].replace("-", np.nan)
+                if df[col].dtype == object:
+                    df[col] = df[col].str.replace(',', '.', regex=False).astype(float)
+        if 'Note/20,00' in df.columns:
+            df = df.dropna(subset=['Note/20,00'])
+        df[question_cols] = df[question_cols].fillna(0)
+    if 'Temps utilisé' in df.columns and 'Temps utilisé (min)' not in df.columns:
+        df['Temps utilisé (min)'] = convertir_temps(df['Temps utilisé'])
+        df = df.drop('Temps utilisé', axis=1)
+    if 'Temps utilisé (min)' in df.columns:
+        df = df[df['Temps utilisé (min)'] < 20]
+    df = df.rename(columns={col: col.split('/')[0].strip() for col in question_cols if '/1,00' in col})
+    important_cols = ['Nom Complet', 'Filière', 'Temps utilisé (min)', 'Note/20,00']
+    question_cols = [col for col in df.columns if col.startswith('Q.')]
+    df = df[[col for col in important_cols if col in df.columns] + question_cols]
+    return df.dropna().drop_duplicates()
+
+def _lire_status(champ):
+    # Valeur en Mo d'un champ de /proc/self/status (VmRSS, VmHWM)
+    with open("/proc/self/status") as f:
+        for ligne in f:
+            if ligne.startswith(champ + ":"):
+                return int(ligne.split()[1]) / 1024
+    return 0.0
+
+def _mesurer_rss(variante, chemin_csv, file):
+    # Exécuté dans un processus neuf : pic de RSS pendant le nettoyage seul
+    df = pd.read_csv(chemin_csv)
+    df["Filière"] = "BCG"
+    # Remise à zéro du pic (Linux) pour ne pas compter la lecture du CSV
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    avant = _lire_status("VmRSS")
+    debut = time.perf_counter()
+    nettoyage = _nettoyer_donnees_ancien if variante == "ancien" else nettoyer_donnees
+    resultat = nettoyage(df)
+    duree = time.perf_counter() - debut
+    pic = _lire_status("VmHWM") - avant
+    file.put((duree, pic, resultat.memory_usage(deep=True).sum() / 1024 ** 2))
+
+def bench_nettoyage(args):
+    # Pic de RSS de nettoyer_donnees contre l'ancienne version (un processus par variante, Linux)
+    with tempfile.TemporaryDirectory() as dossier:
+        chemin = os.path.join(dossier, "export.csv")
+        generer_export(args.lignes, args.questions).iloc[:-1].to_csv(chemin, index=False)
+
+        contexte = multiprocessing.get_context("spawn")
+        print(f"{args.lignes} lignes x {args.questions} questions")
+        for variante in ["ancien", "nouveau"]:
+            file = contexte.Queue()
+            processus = contexte.Process(target=_mesurer_rss, args=(variante, chemin, file))
+            processus.start()
+            duree, pic, taille = file.get()
+            processus.join()
+            print(f"{variante:8s}: {duree:.2f} s, +{pic:.0f} Mo de RSS, résultat {taille:.0f} Mo")
+
+def generer_analyse(lignes, filieres=200, seed=0):
+    # Données déjà nettoyées et clusterisées
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Nom Complet": [f"Etudiant {i}" for i in range(lignes)],
+        "Filière": rng.integers(0, filieres, lignes).astype(str).astype(object),
+        "Temps utilisé (min)": rng.uniform(0, 20, lignes),
+        "Note/20,00": rng.uniform(0, 20, lignes).round(2),
+        "Cluster": rng.integers(1, 5, lignes),
+    })
+
+def _top_boucle(dataframe, n=5):
+    # Ancienne version : un masque et un tri par filière
+    top_students_dict = {}
+    for filiere in dataframe["Filière"].unique():
+        filiere_df = dataframe[dataframe["Filière"] == filiere]
+        top_students_dict[filiere] = filiere_df.sort_values(by="Note/20,00", ascending=False, kind="stable").head(n)
+    return top_students_dict
+
+def _profil_boucle(df):
+    # Ancienne version : un filtre par cluster
+    profil = []
+    for cluster in sorted(df['Cluster'].unique()):
+        cluster_data = df[df['Cluster'] == cluster]
+        profil.append({"Nom du groupe": LEGENDES_EMOTIONS[cluster],
+                       "Nombre d'étudiants": len(cluster_data),
+                       "Note moyenne": round(cluster_data['Note/20,00'].mean(), 2),
+                       "Temps moyen (min)": round(cluster_data['Temps utilisé (min)'].mean(), 2)})
+    return pd.DataFrame(profil)
+
+def bench_agregations(args):
+    df = generer_analyse(args.lignes, args.filieres)
+
+    t_boucle, attendu = chronometrer(_top_boucle, df, repetitions=1)
+    t_groupby, obtenu = chronometrer(get_top_students, df)
+    assert list(attendu) == list(obtenu)
+    for filiere in attendu:
+        pd.testing.assert_frame_equal(attendu[filiere], obtenu[filiere])
+    print(f"top 5 ({args.filieres} filières, {args.lignes} lignes)")
+    print(f"  boucle  : {t_boucle:.3f} s")
+    print(f"  groupby : {t_groupby:.3f} s  (x{t_boucle / t_groupby:.1f})")
+
+    t_boucle, attendu = chronometrer(_profil_boucle, df)
+    t_groupby, obtenu = chronometrer(profil_clusters, df)
+    pd.testing.assert_frame_equal(attendu, obtenu[attendu.columns], check_dtype=False)
+    print("profil des clusters")
+    print(f"  boucle  : {t_boucle:.3f} s")
+    print(f"  groupby : {t_groupby:.3f} s  (x{t_boucle / t_groupby:.1f})")
+
+def _selection_copie(df, selection, question_cols, model, scaler):
+    # Ancienne version : filtre isin puis recalcul complet de chaque section
+    filtre = df[df["Filière"].isin(selection)]
+    taux = filtre[question_cols].mean()
+    top = get_top_students(filtre, n=5)
+    profil = profil_clusters(appliquer_clustering(filtre.copy(), model, scaler).reset_index(drop=True))
+    return filtre, taux, top, profil
+
+def _selection_partiels(df, index, partiels, top_filieres, selection, question_cols):
+    positions = positions_selection(index, selection)
+    filtre = df if positions is None else df.take(positions)
+    taux = moyennes_selection(index, selection, question_cols)
+    choisies = set(selection)
+    top = {filiere: t for filiere, t in top_filieres.items() if filiere in choisies}
+    return filtre, taux, top, profil_selection(partiels, index, selection)
+
+def bench_filtrage(args):
+    model, scaler = charger_modele()
+    df = generer_analyse(args.lignes, args.filieres)
+    df["Filière"] = df["Filière"].astype("category")
+    question_cols = [col for col in df.columns if col.startswith("Q.")]
+
+    # Précalcul, une fois par jeu de données
+    debut = time.perf_counter()
+    index = index_filieres(df, question_cols)
+    partiels = partiels_clusters(df, index, model, scaler)
+    top_filieres = get_top_students(df, n=5)
+    t_index = time.perf_counter() - debut
+
+    filieres = index["filieres"]
+    selections = [filieres, filieres[::2], filieres[:1]]
+    print(f"sélection de filières ({args.filieres} filières, {args.lignes} lignes), index : {t_index:.3f} s")
+    for selection in selections:
+        t_copie, attendu = chronometrer(_selection_copie, df, selection, question_cols, model, scaler)
+        t_partiels, obtenu = chronometrer(_selection_partiels, df, index, partiels, top_filieres, selection,
+                                          question_cols)
+        pd.testing.assert_frame_equal(attendu[0], obtenu[0])
+        np.testing.assert_allclose(attendu[1].to_numpy(), obtenu[1].to_numpy(), rtol=1e-6)
+        assert list(attendu[2]) == list(obtenu[2])
+        pd.testing.assert_frame_equal(attendu[3], obtenu[3])
+        print(f"  {len(selection)} filières : isin + recalcul {t_copie:.3f} s, "
+              f"partiels {t_partiels:.3f} s  (x{t_copie / t_partiels:.1f})")
+
+def _sessions_copies(df, sessions):
+    # Ancienne version : st.cache_data renvoie à chaque session une copie (pickle) du jeu
+    contenu = pickle.dumps(df)
+    return [pickle.loads(contenu) for _ in range(sessions)]
+
+def _sessions_vues(cache, cle, sessions):
+    return [cache.lire(cle) for _ in range(sessions)]
+
+def bench_partage(args):
+    df = generer_analyse(args.lignes, args.filieres)
+    df["Filière"] = df["Filière"].astype("category")
+    cache = CachePartage()
+    vue = cache.ajouter(("bench",), df)
+    pd.testing.assert_frame_equal(vue.astype({"Nom Complet": object}), df)
+
+    t_copies, m_copies, _ = mesurer_memoire(_sessions_copies, df, args.sessions)
+    t_vues, m_vues, _ = mesurer_memoire(_sessions_vues, cache, ("bench",), args.sessions)
+    stats = cache.statistiques()
+    print(f"{args.sessions} sessions sur un jeu de {args.lignes} lignes (cache : {stats['taille_mo']:.0f} Mo, "
+          f"DataFrame : {df.memory_usage(deep=True).sum() / 1024 ** 2:.0f} Mo)")
+    print(f"  copies (cache_data) : {t_copies:.3f} s, {m_copies:.0f} Mo alloués")
+    print(f"  vues partagées      : {t_vues:.3f} s, {m_vues:.1f} Mo alloués  (x{t_copies / t_vues:.0f})")
+
+def _rendu_sequentiel(figures):
+    # Ancienne version : un write_image vers un PNG temporaire relu puis supprimé
+    images = []
+    for fig in figures:
+        chemin = os.path.join(tempfile.gettempdir(), f"bench_{len(images)}.png")
+        fig.write_image(chemin)
+        with open(chemin, "rb") as f:
+            images.append(f.read())
+        os.remove(chemin)
+    return images
+
+def bench_rendu(args):
+    model, scaler = charger_modele()
+    df = appliquer_clustering(generer_analyse(args.lignes, filieres=4), model, scaler)
+    figures = [figure_notes(df), figure_clusters(df), figure_clusters(df.head(len(df) // 2))]
+
+    _rendu_sequentiel(figures[:1])  # démarrage de Kaleido hors mesure
+    t_seq, _ = chronometrer(_rendu_sequentiel, figures, repetitions=1)
+    pg.rasteriser(figures)  # démarrage des scopes Kaleido hors mesure
+    pg._cache_images.clear()
+    t_par, _ = chronometrer(pg.rasteriser, figures, repetitions=1)
+    t_cache, _ = chronometrer(pg.rasteriser, figures)
+    print(f"{len(figures)} figures ({args.lignes} points)")
+    print(f"séquentiel (fichiers) : {t_seq:.2f} s")
+    print(f"parallèle             : {t_par:.2f} s  (x{t_seq / t_par:.1f})")
+    print(f"depuis le cache       : {t_cache:.3f} s")
+
+class _PDFAncien(pg.PDF):
+    # Chargement des polices d'origine : add_font par chemin relatif, sous-ensemble reconstruit à chaque PDF
+    def __init__(self):
+        pg.FPDF.__init__(self)
+        self.add_font('DejaVu', '', os.path.join(pg.DOSSIER_POLICES, 'DejaVuSans.ttf'), uni=True)
+        self.add_font('DejaVu', 'B', os.path.join(pg.DOSSIER_POLICES, 'DejaVuSans-Bold.ttf'), uni=True)
+        self.set_font('DejaVu', 'B', 16)
+
+    def _putfonts(self):
+        pg.FPDF._putfonts(self)
+
+    def _putTTfontwidths(self, font, maxUni):
+        pg.FPDF._putTTfontwidths(self, font, maxUni)
+
+def _rapports_texte(classe, df, dossier):
+    # Un PDF texte par filière (tableau des étudiants), sans graphiques
+    tailles = 0
+    for i, (filiere, groupe) in enumerate(df.groupby("Filière", observed=True)):
+        pdf = classe()
+        pdf.add_page()
+        pdf.cell(200, 10, f"Filière : {filiere}", ln=True)
+        pdf.tableau(["Nom Complet", "Note/20,00", "Temps utilisé (min)", "Émotion"],
+                    groupe[["Nom Complet", "Note/20,00", "Temps utilisé (min)", "Émotion"]].astype(str).values.tolist(),
+                    largeurs=[60, 30, 40, 50])
+        chemin = os.path.join(dossier, f"{i}.pdf")
+        pdf.output(chemin)
+        tailles += os.path.getsize(chemin)
+    return tailles
+
+def bench_polices(args):
+    model, scaler = charger_modele()
+    df = appliquer_clustering(generer_analyse(args.lignes, filieres=args.filieres), model, scaler)
+    with tempfile.TemporaryDirectory() as dossier:
+        t_ancien, taille_ancien = chronometrer(_rapports_texte, _PDFAncien, df, dossier, repetitions=1)
+        t_nouveau, taille_nouveau = chronometrer(_rapports_texte, pg.PDF, df, dossier, repetitions=1)
+    print(f"{args.filieres} rapports ({args.lignes} étudiants)")
+    print(f"add_font par PDF       : {t_ancien:.2f} s, {taille_ancien / 1e6:.1f} Mo")
+    print(f"polices partagées      : {t_nouveau:.2f} s, {taille_nouveau / 1e6:.1f} Mo  (x{t_ancien / t_nouveau:.1f})")
+
+def bench_etudiants(args):
+    model, scaler = charger_modele()
+    rng = np.random.default_rng(0)
+    df = generer_analyse(args.lignes, filieres=args.filieres)
+    for q in range(1, args.questions + 1):
+        df[f"Q. {q}"] = rng.integers(0, 2, args.lignes).astype(np.float32)
+    df = appliquer_clustering(df, model, scaler)
+    with tempfile.TemporaryDirectory() as dossier:
+        t, n = chronometrer(generer_rapports_etudiants, df, os.path.join(dossier, "rapports.zip"),
+                            workers=args.workers, repetitions=1)
+        taille = os.path.getsize(os.path.join(dossier, "rapports.zip"))
+    print(f"{n} rapports individuels ({args.filieres} filières, {args.questions} questions)")
+    print(f"{t:.2f} s ({1000 * t / n:.1f} ms/rapport), archive {taille / 1e6:.1f} Mo")
+
+# Modules lourds qui ne doivent pas être importés au démarrage de l'application
+MODULES_DIFFERES = ("seaborn", "matplotlib", "sklearn", "joblib", "fpdf", "kaleido", "PIL.Image", "plotly.express")
+
+def _imports_demarrage(chemin):
+    # Instructions import exécutées au chargement du script (niveau module uniquement)
+    with open(chemin, encoding="utf-8") as f:
+        arbre = ast.parse(f.read())
+    return [ast.unparse(noeud) for noeud in arbre.body if isinstance(noeud, (ast.Import, ast.ImportFrom))]
+
+def _mesurer_imports(code):
+    # python -X importtime dans un nouveau processus : (durée cumulée en s, modules chargés)
+    resultat = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    total = 0
+    modules = set()
+    for ligne in resultat.stderr.splitlines():
+        if not ligne.startswith("import time:") or "|" not in ligne:
+            continue
+        _, cumul, nom = ligne.split("|")
+        if not cumul.strip().isdigit():
+            continue
+        modules.add(nom.strip())
+        # Modules importés directement par le code (les autres sont inclus dans leur durée cumulée)
+        if len(nom) - len(nom.lstrip()) == 1:
+            total += int(cumul)
+    return total / 1e6, modules
+
+def bench_demarrage(args):
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    code = "\n".join(_imports_demarrage(app))
+    duree, modules = min(_mesurer_imports(code) for _ in range(3))
+    differes, _ = _mesurer_imports("import pdf_generator, entrainement; pdf_generator._classe_scope()")
+
+    charges = sorted(m for m in MODULES_DIFFERES if any(nom == m or nom.startswith(m + ".") for nom in modules))
+    print(f"imports au démarrage de app.py : {duree:.2f} s (budget {args.budget:.2f} s)")
+    print(f"imports différés (PDF, entraînement) : {differes:.2f} s")
+    if charges:
+        print(f"ÉCHEC : modules lourds importés au démarrage : {', '.join(charges)}")
+    if duree > args.budget:
+        print("ÉCHEC : budget de démarrage dépassé")
+    if charges or duree > args.budget:
+        sys.exit(1)
+
+def generer_exports(lignes, questions=20, filieres=4, seed=0, question_vide=False):
+    # Un export CSV par filière (la filière est lue dans le nom du fichier, comme pour Moodle)
+    fichiers = []
+    for i in range(filieres):
+        n = lignes // filieres + (i < lignes % filieres)
+        contenu = generer_export(n, questions, seed + i, question_vide).to_csv(index=False).encode("utf-8")
+        fichiers.append((contenu, f"Quiz MTU F{i}-2024.csv"))
+    return fichiers
+
+def _etapes_pipeline(fichiers, model, scaler, arrow=False):
+    # Durée (s) de chaque étape de l'analyse, dans l'ordre de l'application
+    etapes = {}
+
+    def mesurer(nom, fonction, *args, **kwargs):
+        debut = time.perf_counter()
+        resultat = fonction(*args, **kwargs)
+        etapes[nom] = etapes.get(nom, 0.0) + time.perf_counter() - debut
+        return resultat
+
+    bruts = [mesurer("lecture", lire_fichier, contenu, nom, arrow) for contenu, nom in fichiers]
+    temps = pd.concat([df["Temps utilisé"] for df in bruts], ignore_index=True)
+    mesurer("convert_time", temps.apply, convert_time)
+    mesurer("convertir_temps", convertir_temps, temps)
+    nettoyes = [mesurer("nettoyage", nettoyer_donnees, df) for df in bruts]
+    df = mesurer("fusion", lambda: typer_donnees(fusionner_donnees(nettoyes)).reset_index(drop=True))
+
+    question_cols = [col for col in df.columns if col.startswith("Q.")]
+    top = mesurer("top", get_top_students, df, n=5)
+    df = mesurer("clustering", appliquer_clustering, df, model, scaler)
+    fig1 = mesurer("graphiques", figure_notes, df)
+    fig2 = mesurer("graphiques", figure_reussite, df, question_cols)
+    fig3 = mesurer("graphiques", figure_clusters, df)
+    profil = mesurer("profil", profil_clusters, df, metadonnees_modele(model, scaler))
+
+    # PNG non mis en cache : le rendu Kaleido fait partie de la mesure
+    pg._cache_images.clear()
+    chemin = mesurer("pdf", pg.generer_pdf, df, fig1, fig2, fig3=fig3, profil_df=profil, top_students_dict=top)
+    os.remove(chemin)
+    # convert_time (version ligne à ligne) sert de référence, hors total
+    etapes["total"] = sum(duree for nom, duree in etapes.items() if nom != "convert_time")
+    return len(df), {nom: round(duree, 4) for nom, duree in etapes.items()}
+
+def _revision_git():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_pipeline(args):
+    model, scaler = charger_modele()
+    # Passe de chauffe hors mesure : imports différés, démarrage de Kaleido (Chromium)
+    _etapes_pipeline(generer_exports(200, args.questions, args.filieres, seed=99), model, scaler)
+
+    resultats = []
+    for lignes in args.tailles:
+        fichiers = generer_exports(lignes, args.questions, args.filieres)
+        mesures = [_etapes_pipeline(fichiers, model, scaler) for _ in range(args.repetitions)]
+        # Meilleur temps de chaque étape sur les répétitions
+        etapes = {nom: min(m[1][nom] for m in mesures) for nom in mesures[0][1]}
+        resultats.append({"lignes": lignes, "lignes_nettoyees": mesures[0][0], "etapes": etapes})
+        print(f"{lignes} lignes ({mesures[0][0]} après nettoyage, {args.filieres} filières, {args.questions} questions)")
+        for nom, duree in etapes.items():
+            print(f"  {nom:<16} {duree:8.3f} s")
+
+    enregistrement = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": _revision_git(),
+        "machine": {"python": platform.python_version(), "systeme": platform.platform(), "cpu": os.cpu_count()},
+        "parametres": {"questions": args.questions, "filieres": args.filieres, "repetitions": args.repetitions},
+        "resultats": resultats,
+    }
+
+    if args.reference:
+        # Comparaison avec le dernier enregistrement du fichier de référence (mêmes tailles)
+        with open(args.reference, encoding="utf-8") as f:
+            reference = [json.loads(ligne) for ligne in f if ligne.strip()][-1]
+        anciens = {r["lignes"]: r["etapes"] for r in reference["resultats"]}
+        print(f"comparaison avec {reference['revision']} ({reference['date']}), ratio nouveau / ancien")
+        for resultat in resultats:
+            ancien = anciens.get(resultat["lignes"])
+            if ancien is None:
+                continue
+            ratios = ", ".join(f"{nom} x{duree / ancien[nom]:.2f}" for nom, duree in resultat["etapes"].items()
+                               if ancien.get(nom))
+            print(f"  {resultat['lignes']} lignes : {ratios}")
+
+    if args.sortie:
+        # Une ligne JSON par exécution : le fichier garde l'historique des mesures
+        with open(args.sortie, "a", encoding="utf-8") as f:
+            f.write(json.dumps(enregistrement, ensure_ascii=False) + "\n")
+        print(f"résultats ajoutés à {args.sortie}")
+
+def _memoire_mo(df_list):
+    # Mémoire des DataFrames, tampons Arrow compris (tracemalloc ne voit pas le pool Arrow)
+    return sum(df.memory_usage(deep=True).sum() for df in df_list) / 1024 ** 2
+
+def bench_arrow(args):
+    # Mode objet (actuel) contre mode Arrow (EMOTIONNELLA_ARROW=1), de la lecture au PDF
+    model, scaler = charger_modele()
+    for arrow in (False, True):
+        _etapes_pipeline(generer_exports(200, args.questions, args.filieres, seed=99), model, scaler, arrow)
+
+    for lignes in args.tailles:
+        # Avec une question sans réponse : colonne lue en null[pyarrow] en mode Arrow
+        fichiers = generer_exports(lignes, args.questions, args.filieres, question_vide=True)
+        print(f"{lignes} lignes ({args.filieres} filières, {args.questions} questions + 1 sans réponse)")
+
+        # Mêmes données nettoyées dans les deux modes (noms en string[pyarrow] en mode Arrow),
+        # fichiers entiers et lecture par morceaux
+        morceau = max(1, lignes // args.filieres // 4)
+        for contenu, nom in fichiers:
+            for lire in (lambda arrow: traiter_fichier(contenu, nom, arrow),
+                         lambda arrow: nettoyer_csv_par_morceaux(contenu, nom, morceau, arrow=arrow)):
+                pd.testing.assert_frame_equal(lire(True).astype({"Nom Complet": object}), lire(False))
+
+        mesures = {}
+        for arrow in (False, True):
+            bruts = [lire_fichier(contenu, nom, arrow) for contenu, nom in fichiers]
+            df = fusionner_donnees([nettoyer_donnees(brut) for brut in bruts])
+            memoire = (_memoire_mo(bruts), _memoire_mo([df]))
+            del bruts, df
+            essais = [_etapes_pipeline(fichiers, model, scaler, arrow)[1] for _ in range(args.repetitions)]
+            mesures[arrow] = memoire, {nom: min(e[nom] for e in essais) for nom in essais[0]}
+
+        (brut_o, propre_o), etapes_o = mesures[False]
+        (brut_a, propre_a), etapes_a = mesures[True]
+        print(f"  mémoire brute      objet {brut_o:8.1f} Mo   arrow {brut_a:8.1f} Mo  (x{brut_o / brut_a:.1f})")
+        print(f"  mémoire nettoyée   objet {propre_o:8.1f} Mo   arrow {propre_a:8.1f} Mo  (x{propre_o / propre_a:.1f})")
+        for nom in etapes_o:
+            if nom != "convert_time":
+                print(f"  {nom:<16}   objet {etapes_o[nom]:8.3f} s    arrow {etapes_a[nom]:8.3f} s")
+
+BENCHMARKS = {
+    "temps": bench_temps,
+    "ingestion": bench_ingestion,
+    "agregations": bench_agregations,
+    "streaming": bench_streaming,
+    "nettoyage": bench_nettoyage,
+    "rendu": bench_rendu,
+    "polices": bench_polices,
+    "etudiants": bench_etudiants,
+    "demarrage": bench_demarrage,
+    "pipeline": bench_pipeline,
+    "filtrage": bench_filtrage,
+    "partage": bench_partage,
+    "arrow": bench_arrow,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks Émotionnella")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--lignes", type=int, default=1_000_000)
+    parser.add_argument("--fichiers", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--filieres", type=int, default=None, help="200 par défaut, 4 exports pour pipeline")
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--tailles", type=lambda v: [int(t) for t in v.split(",")], default=[1_000, 10_000, 100_000],
+                        help="Tailles des jeux synthétiques, ex. 1000,10000,100000")
+    parser.add_argument("--repetitions", type=int, default=1)
+    parser.add_argument("--sessions", type=int, default=10, help="Sessions simultanées (partage)")
+    parser.add_argument("--sortie", default=None, help="Fichier JSON Lines où ajouter les résultats")
+    parser.add_argument("--reference", default=None, help="Fichier JSON Lines de référence à comparer")
+    parser.add_argument("--budget", type=float, default=1.5, help="Budget d'import au démarrage (s)")
+    args = parser.parse_args()
+    if args.filieres is None:
+        args.filieres = 4 if args.benchmark in ("pipeline", "arrow") else 200
+    BENCHMARKS[args.benchmark](args)
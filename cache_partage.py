@@ -0,0 +1,154 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Mémoire maximale des entrées du cache (Mo), pour tout le processus Streamlit
+BUDGET_CACHE_MO = int(os.environ.get("EMOTIONNELLA_BUDGET_CACHE_MO", 1024))
+
+# Colonnes texte lues sans conversion en objets Python (vue sur les tampons Arrow)
+_TYPES_VUE = {pa.string(): pd.StringDtype("pyarrow"), pa.large_string(): pd.StringDtype("pyarrow")}.get
+
+def taille_valeur(valeur):
+    # Estimation de la mémoire occupée (octets)
+    if isinstance(valeur, pa.Table):
+        return valeur.nbytes
+    if isinstance(valeur, (pd.DataFrame, pd.Series, pd.Index)):
+        taille = valeur.memory_usage(deep=True)
+        return int(taille.sum() if isinstance(taille, pd.Series) else taille)
+    if isinstance(valeur, np.ndarray):
+        return valeur.nbytes
+    if isinstance(valeur, dict):
+        return sys.getsizeof(valeur) + sum(taille_valeur(cle) + taille_valeur(v) for cle, v in valeur.items())
+    if isinstance(valeur, (list, tuple, set, frozenset)):
+        return sys.getsizeof(valeur) + sum(taille_valeur(v) for v in valeur)
+    return sys.getsizeof(valeur)
+
+def _lecture_seule(valeur):
+    if isinstance(valeur, np.ndarray):
+        valeur.flags.writeable = False
+    elif isinstance(valeur, (dict, list, tuple)):
+        for v in (valeur.values() if isinstance(valeur, dict) else valeur):
+            _lecture_seule(v)
+
+def _figer(valeur):
+    # Stockage immuable : DataFrame -> table Arrow, tableaux numpy en lecture seule
+    if isinstance(valeur, pd.DataFrame):
+        try:
+            return pa.Table.from_pandas(valeur, preserve_index=not isinstance(valeur.index, pd.RangeIndex))
+        except (pa.ArrowException, ValueError):
+            # Colonne non convertible (types mélangés) : gardée telle quelle
+            return valeur
+    _lecture_seule(valeur)
+    return valeur
+
+def _vue(valeur):
+    # Table Arrow -> DataFrame sans copie : colonnes numériques en lecture seule, texte en
+    # string[pyarrow]. Chaque session peut ajouter ses colonnes sans toucher à l'entrée partagée
+    if isinstance(valeur, pa.Table):
+        return valeur.to_pandas(split_blocks=True, types_mapper=_TYPES_VUE)
+    if isinstance(valeur, pd.DataFrame):
+        return valeur.copy(deep=False)
+    return valeur
+
+class CachePartage:
+    # Cache commun à toutes les sessions (threads) du serveur, borné en mémoire : les entrées
+    # les moins récemment utilisées sont supprimées au-delà du budget. Les valeurs sont
+    # partagées sans copie et ne doivent pas être modifiées
+    def __init__(self, budget_mo=BUDGET_CACHE_MO):
+        self.budget = budget_mo * 1024 ** 2
+        self.taille = 0
+        self.succes = 0
+        self.echecs = 0
+        self.evictions = 0
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+        # Un seul calcul par clé à la fois : les autres sessions attendent son résultat
+        self._calculs = {}
+
+    def lire(self, cle):
+        # Vue de la valeur en cache, ou None (compté comme échec)
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is None:
+                self.echecs += 1
+                return None
+            self._entrees.move_to_end(cle)
+            self.succes += 1
+        return _vue(entree[0])
+
+    def ajouter(self, cle, valeur):
+        # Met la valeur en cache et en renvoie une vue ; une valeur plus grande que le budget
+        # n'est pas gardée
+        valeur = _figer(valeur)
+        taille = taille_valeur(valeur)
+        with self._verrou:
+            ancienne = self._entrees.pop(cle, None)
+            if ancienne is not None:
+                self.taille -= ancienne[1]
+            if taille <= self.budget:
+                self._entrees[cle] = (valeur, taille)
+                self.taille += taille
+                while self.taille > self.budget:
+                    _, (_, taille_sortie) = self._entrees.popitem(last=False)
+                    self.taille -= taille_sortie
+                    self.evictions += 1
+        return _vue(valeur)
+
+    def obtenir(self, cle, calcul, *args, **kwargs):
+        # Vue de la valeur en cache, calculée par calcul(*args, **kwargs) si absente
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is not None:
+                self._entrees.move_to_end(cle)
+                self.succes += 1
+                return _vue(entree[0])
+            verrou_cle = self._calculs.setdefault(cle, threading.Lock())
+        with verrou_cle:
+            try:
+                # Calculée par une autre session pendant l'attente
+                with self._verrou:
+                    entree = self._entrees.get(cle)
+                    if entree is not None:
+                        self._entrees.move_to_end(cle)
+                        self.succes += 1
+                        return _vue(entree[0])
+                    self.echecs += 1
+                return self.ajouter(cle, calcul(*args, **kwargs))
+            finally:
+                with self._verrou:
+                    self._calculs.pop(cle, None)
+
+    def vider(self):
+        with self._verrou:
+            self._entrees.clear()
+            self.taille = 0
+
+    def statistiques(self):
+        with self._verrou:
+            return {
+                "entrees": len(self._entrees),
+                "taille_mo": self.taille / 1024 ** 2,
+                "budget_mo": self.budget / 1024 ** 2,
+                "succes": self.succes,
+                "echecs": self.echecs,
+                "evictions": self.evictions,
+            }
+
+    def vers_prometheus(self, prefixe="emotionnella_cache"):
+        # Compteurs au format texte Prometheus (même présentation que Journal.vers_prometheus)
+        stats = self.statistiques()
+        series = [("entrees", "gauge", stats["entrees"], "Entrées en cache"),
+                  ("octets", "gauge", self.taille, "Mémoire occupée par les entrées (octets)"),
+                  ("budget_octets", "gauge", self.budget, "Budget mémoire du cache (octets)"),
+                  ("succes_total", "counter", stats["succes"], "Lectures servies par le cache"),
+                  ("echecs_total", "counter", stats["echecs"], "Lectures absentes du cache"),
+                  ("evictions_total", "counter", stats["evictions"], "Entrées supprimées pour respecter le budget")]
+        lignes = []
+        for suffixe, type_serie, valeur, aide in series:
+            lignes += [f"# HELP {prefixe}_{suffixe} {aide}", f"# TYPE {prefixe}_{suffixe} {type_serie}",
+                       f"{prefixe}_{suffixe} {valeur}"]
+        return "\n".join(lignes) + "\n"
@@ -0,0 +1,214 @@
+import re
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+
+# À changer quand le résultat de nettoyer_donnees change : les fichiers déjà nettoyés
+# (cache mémoire, Parquet de EMOTIONNELLA_CACHE_DIR) ne sont plus servis
+VERSION_NETTOYAGE = 1
+
+# Formats Moodle reconnus : "X heures Y min", "X min Y s", "X s"
+_TEMPS_RE = re.compile(
+    r"^\s*(?:(?P<heures>\d+(?:\.\d*)?)\s*heures?)?"
+    r"\s*(?:(?P<min>\d+(?:\.\d*)?)\s*min)?"
+    r"\s*(?:(?P<sec>\d+(?:\.\d*)?)\s*s)?\s*$"
+)
+
+def convert_time(time_str):
+    if pd.isna(time_str) or time_str == "-":
+        return np.nan
+
+    # Convertir en string si ce n'est pas déjà le cas
+    if not isinstance(time_str, str):
+        return float(time_str)
+
+    # Cas 1: Format "X heures Y min"
+    if 'heures' in time_str:
+        parts = time_str.split('heures')
+        heures = float(parts[0].strip())
+        reste = parts[1].strip()
+
+        if 'min' in reste:
+            mins = float(reste.split('min')[0].strip())
+        else:
+            mins = 0
+        return heures * 60 + mins
+
+    # Cas 2: Format "X min Y s"
+    elif 'min' in time_str:
+        parts = time_str.split('min')
+        mins = float(parts[0].strip())
+        secs = float(parts[1].replace('s', '').strip()) if 's' in parts[1] else 0
+        return mins + secs / 60
+
+    # Cas 3: Format "X s"
+    elif 's' in time_str:
+        return float(time_str.replace('s', '').strip()) / 60
+
+    # Si aucun format reconnu
+    else:
+        try:
+            return float(time_str)
+        except:
+            return np.nan
+
+def convertir_temps(serie):
+    # Version vectorisée de convert_time : renvoie une Series de minutes (NaN si illisible)
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float)
+
+    # Les exports répètent beaucoup les mêmes durées : on ne parse que les valeurs uniques
+    codes, uniques = pd.factorize(serie, use_na_sentinel=True)
+    if len(uniques) == 0:
+        return pd.Series(np.nan, index=serie.index, dtype=float)
+
+    textes = pd.Series(uniques).astype(str)
+    parties = textes.str.extract(_TEMPS_RE).astype(float)
+    heures, mins, secs = parties["heures"], parties["min"], parties["sec"]
+
+    # Comme convert_time, les secondes sont ignorées dès qu'il y a des heures
+    minutes = np.where(
+        heures.notna(),
+        heures * 60 + mins.fillna(0),
+        mins.fillna(0) + secs.fillna(0) / 60,
+    )
+    avec_unite = parties.notna().any(axis=1).to_numpy()
+    # Valeurs sans unité ("12.5", nombres déjà convertis) ; "-" et le reste deviennent NaN
+    valeurs = np.where(avec_unite, minutes, pd.to_numeric(textes, errors="coerce").to_numpy(dtype=float))
+
+    resultat = np.append(valeurs, np.nan)[codes]
+    return pd.Series(resultat, index=serie.index, dtype=float)
+
+def _convertir_bloc(df, cols, question_cols):
+    # Conversion en float32 de toutes les colonnes numériques saisies en texte ("-" pour
+    # les réponses vides, virgule décimale). Les valeurs distinctes du bloc entier sont
+    # converties en une seule opération ; les NaN des questions deviennent 0
+    resultat = {}
+    codes_par_col = {}
+    uniques = []
+    for col in cols:
+        # Colonne sans aucune valeur : null[pyarrow] en mode Arrow, équivalent d'une colonne de NaN
+        if isinstance(df[col].dtype, pd.ArrowDtype) and pa.types.is_null(df[col].dtype.pyarrow_dtype):
+            resultat[col] = np.full(len(df), 0 if col in question_cols else np.nan, dtype=np.float32)
+        # Texte en object ou en chaînes Arrow (mode Arrow de data_loader)
+        elif not pd.api.types.is_numeric_dtype(df[col]):
+            codes, valeurs = pd.factorize(df[col])
+            codes_par_col[col] = (codes, len(uniques), len(valeurs))
+            uniques.extend(valeurs)
+        else:
+            resultat[col] = df[col].to_numpy(dtype=np.float32, na_value=np.nan, copy=True)
+            if col in question_cols:
+                resultat[col][np.isnan(resultat[col])] = 0
+
+    # Les exports ne contiennent qu'une poignée de valeurs distinctes ("1,00", "0,00", "-"...)
+    uniques = pd.Series(uniques, dtype=object)
+    # "-" et les valeurs manquantes (pd.NA des colonnes Arrow) deviennent NaN
+    nombres = (uniques.where(uniques.notna() & (uniques != "-")).astype(str)
+               .str.replace(',', '.', regex=False).astype(float).to_numpy(dtype=np.float32))
+
+    for col, (codes, debut, nb) in codes_par_col.items():
+        # Dernière case de la table : valeurs manquantes (code -1)
+        table = np.append(nombres[debut:debut + nb], np.float32(np.nan))
+        if col in question_cols:
+            table[np.isnan(table)] = 0
+        resultat[col] = table[codes]
+    return resultat
+
+def _texte_arrow(valeurs):
+    # Colonne de chaînes stockée par Arrow (ArrowDtype ou string[pyarrow])
+    type_ = valeurs.dtype
+    return isinstance(type_, (pd.ArrowDtype, pd.StringDtype)) and not pd.api.types.is_numeric_dtype(type_)
+
+def nettoyer_donnees(df):
+    # Les colonnes sont converties en tableaux, les lignes filtrées une seule fois à la fin
+    with pd.option_context("mode.copy_on_write", True):
+        # 1. Création du Nom Complet
+        if 'Prénom' in df.columns and 'Nom' in df.columns and 'Nom Complet' not in df.columns:
+            df = df.assign(**{'Nom Complet': df['Prénom'] + ' ' + df['Nom']})
+
+        # 2. Identification des colonnes de questions avec format standard
+        question_cols = [col for col in df.columns if col.startswith('Q.') and '/1,00' in col]
+
+        if not question_cols:
+            question_cols = [col for col in df.columns if col.startswith('Q.')]
+
+        # 3. Traitement des colonnes numériques (questions et note finale)
+        num_cols = question_cols + [col for col in ['Note/20,00'] if col in df.columns]
+        # (les NaN des questions sont remplacés par 0 pendant la conversion)
+        colonnes = _convertir_bloc(df, num_cols, set(question_cols))
+        valide = np.ones(len(df), dtype=bool)
+
+        # Supprimer les lignes où la note finale est NaN
+        if 'Note/20,00' in colonnes:
+            valide &= ~np.isnan(colonnes['Note/20,00'])
+
+        # 4. Traitement du temps
+        if 'Temps utilisé' in df.columns and 'Temps utilisé (min)' not in df.columns:
+            colonnes['Temps utilisé (min)'] = convertir_temps(df['Temps utilisé']).to_numpy()
+        elif 'Temps utilisé (min)' in df.columns:
+            colonnes['Temps utilisé (min)'] = df['Temps utilisé (min)'].to_numpy(dtype=float, na_value=np.nan)
+
+        # 5. Limitation du temps autorisé à 35 minutes
+        if 'Temps utilisé (min)' in colonnes:
+            valide &= colonnes['Temps utilisé (min)'] < 20
+
+        # 6. Normalisation des noms de colonnes pour les questions
+        noms = {col: col.split('/')[0].strip() if col in question_cols and '/1,00' in col else col
+                for col in df.columns if col != 'Temps utilisé'}
+        if 'Temps utilisé (min)' in colonnes:
+            noms['Temps utilisé (min)'] = 'Temps utilisé (min)'
+
+        # 7. Réorganisation et sélection des colonnes importantes
+        important_cols = ['Nom Complet', 'Filière', 'Temps utilisé (min)', 'Note/20,00']
+        sources = {nom: col for col, nom in noms.items()}
+        question_sorties = [nom for nom in noms.values() if nom.startswith('Q.')]
+        cols_to_keep = [col for col in important_cols if col in sources] + question_sorties
+        if not cols_to_keep:
+            cols_to_keep = list(sources)
+
+        # Lignes incomplètes exclues avant la copie finale (équivalent du dropna)
+        tableaux = {}
+        for nom in cols_to_keep:
+            col = sources[nom]
+            if col in colonnes:
+                tableaux[nom] = colonnes[col]
+            else:
+                # Les chaînes Arrow restent dans leurs tampons (pas de conversion en objets Python)
+                tableaux[nom] = df[col].array if _texte_arrow(df[col]) else df[col].to_numpy()
+            if col in question_cols:
+                continue
+            elif col in colonnes:
+                valide &= ~np.isnan(tableaux[nom])
+            else:
+                valide &= ~pd.isna(tableaux[nom])
+
+        # Types compacts : scores, notes et temps en float32, Filière catégorielle,
+        # texte Arrow en string[pyarrow] (même type que les vues de cache_partage)
+        resultat = {}
+        for nom, valeurs in tableaux.items():
+            valeurs = valeurs[valide]
+            if sources[nom] in colonnes:
+                valeurs = valeurs.astype(np.float32, copy=False)
+            elif nom == 'Filière':
+                valeurs = pd.Categorical(valeurs)
+                # Catégories en object dans les deux modes : filtres et graphiques inchangés
+                if _texte_arrow(valeurs.categories):
+                    valeurs = valeurs.set_categories(valeurs.categories.astype(object))
+            elif _texte_arrow(valeurs):
+                valeurs = valeurs.astype(pd.StringDtype("pyarrow"))
+            resultat[nom] = valeurs
+        df = pd.DataFrame(resultat, index=df.index[valide])
+
+        doublons = df.duplicated()
+        return df[~doublons] if doublons.any() else df
+
+def typer_donnees(df):
+    # Types compacts : Filière catégorielle, notes, questions et temps en float32
+    df = df.copy()
+    if 'Filière' in df.columns:
+        df['Filière'] = df['Filière'].astype('category')
+    float_cols = [col for col in ['Temps utilisé (min)', 'Note/20,00'] if col in df.columns]
+    float_cols += [col for col in df.columns if col.startswith('Q.')]
+    if float_cols:
+        df[float_cols] = df[float_cols].astype('float32')
+    return df
@@ -0,0 +1,242 @@
+import hashlib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from data_cleaning import VERSION_NETTOYAGE, nettoyer_donnees
+
+# Au-delà de cette taille, un CSV est lu et nettoyé par morceaux
+TAILLE_STREAMING_CSV = 20 * 1024 * 1024
+LIGNES_PAR_MORCEAU = 50_000
+# Mode Arrow (EMOTIONNELLA_ARROW=1) : exports lus par pyarrow, texte gardé en chaînes Arrow
+# (tampons contigus) au lieu d'objets Python jusqu'aux graphiques
+MODE_ARROW = os.environ.get("EMOTIONNELLA_ARROW", "0") == "1"
+
+# --- Lecture d'un fichier exporté ---
+def extraire_filiere(nom_fichier):
+    # Extraire la filière du nom de fichier
+    filiere_match = re.search(r'MTU\s+(\w+)', nom_fichier)
+    if filiere_match:
+        return filiere_match.group(1)
+    # Fallback si le pattern ne correspond pas
+    if "-" in nom_fichier:
+        return nom_fichier.split("-")[0].strip()
+    return nom_fichier.split(".")[0].strip()
+
+def lire_fichier(contenu, nom_fichier, arrow=None):
+    arrow = MODE_ARROW if arrow is None else arrow
+    # Déterminer le format du fichier
+    if nom_fichier.endswith(".csv") and arrow:
+        df = pd.read_csv(io.BytesIO(contenu), engine="pyarrow", dtype_backend="pyarrow")
+    elif nom_fichier.endswith(".csv"):
+        df = pd.read_csv(io.BytesIO(contenu))
+    elif arrow:
+        df = pd.read_excel(io.BytesIO(contenu), dtype_backend="pyarrow")
+    else:
+        df = pd.read_excel(io.BytesIO(contenu))
+
+    # Supprimer la dernière ligne si c'est une moyenne
+    if len(df) > 0 and "Moyenne" in str(df.iloc[-1].values):
+        df = df.iloc[:-1]
+
+    # Créer la colonne filière
+    if "Filière" not in df.columns:
+        df["Filière"] = extraire_filiere(nom_fichier)
+
+    return df
+
+def _nettoyer_morceau(morceau, filiere, vus):
+    # Mêmes règles que pour un fichier entier, puis retrait des lignes déjà vues
+    if "Filière" not in morceau.columns:
+        morceau["Filière"] = filiere
+    morceau = nettoyer_donnees(morceau)
+    empreintes = pd.util.hash_pandas_object(morceau, index=False).to_numpy()
+    nouveaux = ~np.isin(empreintes, vus)
+    return morceau[nouveaux], np.union1d(vus, empreintes)
+
+def nettoyer_csv_par_morceaux(contenu, nom_fichier, lignes_par_morceau=LIGNES_PAR_MORCEAU, arrow=None):
+    # Lecture en continu d'un gros CSV : seuls un morceau brut et les empreintes
+    # des lignes (8 octets par ligne) sont gardés en plus des données nettoyées
+    filiere = extraire_filiere(nom_fichier)
+    vus = np.empty(0, dtype=np.uint64)
+    morceaux = []
+    precedent = None
+
+    # Le moteur pyarrow ne lit pas par morceaux : moteur C, colonnes en types Arrow
+    options = {"dtype_backend": "pyarrow"} if (MODE_ARROW if arrow is None else arrow) else {}
+    for morceau in pd.read_csv(io.BytesIO(contenu), chunksize=lignes_par_morceau, **options):
+        # Un morceau de retard : la ligne Moyenne n'est cherchée que dans le dernier
+        if precedent is not None:
+            propre, vus = _nettoyer_morceau(precedent, filiere, vus)
+            morceaux.append(propre)
+        precedent = morceau
+
+    if precedent is not None:
+        # Supprimer la dernière ligne si c'est une moyenne
+        if len(precedent) > 0 and "Moyenne" in str(precedent.iloc[-1].values):
+            precedent = precedent.iloc[:-1].copy()
+        if len(precedent) > 0:
+            propre, vus = _nettoyer_morceau(precedent, filiere, vus)
+            morceaux.append(propre)
+
+    if not morceaux:
+        return pd.DataFrame()
+    df = pd.concat(morceaux, ignore_index=True)
+    # Filière reste catégorielle si les morceaux n'avaient pas les mêmes catégories
+    if df["Filière"].dtype == object:
+        df["Filière"] = df["Filière"].astype("category")
+    return df
+
+def traiter_fichier(contenu, nom_fichier, arrow=None):
+    # Lecture et nettoyage complets d'un fichier (exécutable dans un processus séparé)
+    if nom_fichier.endswith(".csv") and len(contenu) > TAILLE_STREAMING_CSV:
+        return nettoyer_csv_par_morceaux(contenu, nom_fichier, arrow=arrow)
+    return nettoyer_donnees(lire_fichier(contenu, nom_fichier, arrow)).reset_index(drop=True)
+
+def nombre_workers():
+    # Nombre de processus de lecture (EMOTIONNELLA_WORKERS, sinon un par cœur)
+    valeur = os.environ.get("EMOTIONNELLA_WORKERS")
+    if valeur:
+        return max(1, int(valeur))
+    return os.cpu_count() or 1
+
+def traiter_fichiers(fichiers, workers=None, arrow=None):
+    # fichiers : liste de (contenu, nom). Renvoie une liste de (df, erreur) dans le même ordre
+    workers = nombre_workers() if workers is None else workers
+    workers = min(workers, len(fichiers))
+    resultats = []
+    if workers <= 1:
+        for contenu, nom in fichiers:
+            try:
+                resultats.append((traiter_fichier(contenu, nom, arrow), None))
+            except Exception as e:
+                resultats.append((None, e))
+        return resultats
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(traiter_fichier, contenu, nom, arrow) for contenu, nom in fichiers]
+        for future in futures:
+            try:
+                resultats.append((future.result(), None))
+            except Exception as e:
+                resultats.append((None, e))
+    return resultats
+
+def fusionner_donnees(df_list):
+    # Fusionner des fichiers déjà nettoyés
+    if len(df_list) == 1:
+        return df_list[0]
+    df = pd.concat(df_list, ignore_index=True)
+    # Une question absente d'un fichier compte comme non répondue
+    question_cols = [col for col in df.columns if col.startswith('Q.')]
+    df[question_cols] = df[question_cols].fillna(0)
+    # Des catégories différentes d'un fichier à l'autre redonnent une colonne object
+    if "Filière" in df.columns and df["Filière"].dtype == object:
+        df["Filière"] = df["Filière"].astype("category")
+    return df.dropna().drop_duplicates()
+
+# --- Cache des fichiers téléversés ---
+def empreinte_fichier(contenu, nom_fichier):
+    # Le nom fait partie de la clé : la filière en est déduite
+    h = hashlib.sha256(contenu)
+    h.update(nom_fichier.encode("utf-8"))
+    return h.hexdigest()
+
+def cle_nettoyage(contenu, nom_fichier, arrow=None):
+    # Clé des données nettoyées d'un fichier : contenu, version du nettoyage et mode Arrow
+    arrow = MODE_ARROW if arrow is None else arrow
+    return f"{empreinte_fichier(contenu, nom_fichier)}-v{VERSION_NETTOYAGE}-{'arrow' if arrow else 'objet'}"
+
+class CacheFichiers:
+    def __init__(self, taille_max=32, dossier=None, cache=None):
+        self.taille_max = taille_max
+        self.dossier = dossier
+        # cache : CachePartage qui garde les fichiers en mémoire (budget commun) à la place
+        # de ce cache-ci, borné seulement en nombre de fichiers
+        self.cache = cache
+        self._entrees = OrderedDict()
+        # Partagé entre les sessions Streamlit (threads)
+        self._verrou = threading.Lock()
+        if dossier is not None:
+            os.makedirs(dossier, exist_ok=True)
+
+    def _chemin(self, cle):
+        return os.path.join(self.dossier, f"{cle}.parquet")
+
+    def _lire_disque(self, cle):
+        if self.dossier is None or not os.path.exists(self._chemin(cle)):
+            return None
+        try:
+            return pd.read_parquet(self._chemin(cle))
+        except Exception:
+            # Fichier corrompu ou pyarrow absent : on reparse
+            return None
+
+    def _ecrire_disque(self, cle, df):
+        if self.dossier is None:
+            return
+        try:
+            df.to_parquet(self._chemin(cle), index=False)
+        except Exception:
+            pass
+
+    def _memoriser(self, cle, df):
+        if self.cache is not None:
+            self.cache.ajouter(("fichier", cle), df)
+            return
+        self._entrees[cle] = df
+        self._entrees.move_to_end(cle)
+        while len(self._entrees) > self.taille_max:
+            self._entrees.popitem(last=False)
+
+    def _chercher(self, cle):
+        if self.cache is not None:
+            df = self.cache.lire(("fichier", cle))
+            if df is not None:
+                return df
+        with self._verrou:
+            df = self._entrees.get(cle)
+            if df is not None:
+                self._entrees.move_to_end(cle)
+                return df
+        df = self._lire_disque(cle)
+        if df is not None:
+            with self._verrou:
+                self._memoriser(cle, df)
+        return df
+
+    def _ajouter(self, cle, df):
+        self._ecrire_disque(cle, df)
+        with self._verrou:
+            self._memoriser(cle, df)
+
+    def charger(self, contenu, nom_fichier):
+        # Renvoie les données nettoyées du fichier, sans reparser un contenu déjà vu
+        cle = cle_nettoyage(contenu, nom_fichier)
+        df = self._chercher(cle)
+        if df is None:
+            df = traiter_fichier(contenu, nom_fichier)
+            self._ajouter(cle, df)
+        # Copie : l'appelant ajoute des colonnes (clusters)
+        return df.copy()
+
+    def charger_plusieurs(self, fichiers, workers=None):
+        # Comme charger, pour une liste de (contenu, nom) : les fichiers absents
+        # du cache sont traités en parallèle. Renvoie des (df, erreur) dans l'ordre
+        cles = [cle_nettoyage(contenu, nom) for contenu, nom in fichiers]
+        resultats = [(self._chercher(cle), None) for cle in cles]
+        a_traiter = [i for i, (df, _) in enumerate(resultats) if df is None]
+
+        if a_traiter:
+            nouveaux = traiter_fichiers([fichiers[i] for i in a_traiter], workers)
+            for i, (df, erreur) in zip(a_traiter, nouveaux):
+                if erreur is None:
+                    self._ajouter(cles[i], df)
+                resultats[i] = (df, erreur)
+
+        return [(df.copy() if df is not None else None, erreur) for df, erreur in resultats]
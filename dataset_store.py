@@ -0,0 +1,164 @@
+import argparse
+import io
+import json
+import os
+import threading
+import pandas as pd
+
+from data_cleaning import typer_donnees
+from data_loader import empreinte_fichier, fusionner_donnees, traiter_fichiers
+
+# Dossier du store : une partie Parquet par fichier importé + un manifeste
+DOSSIER_DEFAUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "donnees")
+MANIFESTE = "_manifeste.json"
+
+def _lire_manifeste(dossier):
+    chemin = os.path.join(dossier, MANIFESTE)
+    if not os.path.exists(chemin):
+        return {"fichiers": {}}
+    with open(chemin, encoding="utf-8") as f:
+        return json.load(f)
+
+def _ecrire_manifeste(dossier, manifeste):
+    chemin = os.path.join(dossier, MANIFESTE)
+    tmp = chemin + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifeste, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, chemin)
+
+def _colonnes_application(df):
+    # Colonnes utilisées par l'application (les anciennes colonnes Cluster/Émotion sont recalculées)
+    important_cols = ['Nom Complet', 'Filière', 'Temps utilisé (min)', 'Note/20,00']
+    question_cols = [col for col in df.columns if col.startswith('Q.')]
+    return df[[col for col in important_cols if col in df.columns] + question_cols]
+
+def store_existe(dossier=DOSSIER_DEFAUT):
+    return bool(_lire_manifeste(dossier)["fichiers"])
+
+def signature_store(dossier=DOSSIER_DEFAUT):
+    # Change à chaque import (le manifeste est réécrit) ; None si le store n'existe pas
+    try:
+        infos = os.stat(os.path.join(dossier, MANIFESTE))
+    except OSError:
+        return None
+    return infos.st_mtime_ns, infos.st_size
+
+def signature_fichier(chemin):
+    # Date de modification et taille : un fichier modifié après son import est réimporté
+    infos = os.stat(chemin)
+    return [infos.st_mtime_ns, infos.st_size]
+
+def _nouvelle_partie(manifeste):
+    # Numéro suivant le plus grand déjà utilisé (des parties peuvent avoir été supprimées)
+    numeros = [int(infos["partie"][len("partie-"):-len(".parquet")]) for infos in manifeste["fichiers"].values()]
+    return f"partie-{max(numeros, default=0) + 1:06d}.parquet"
+
+def importer_fichiers(chemins, dossier=DOSSIER_DEFAUT, deja_nettoye=False, workers=None):
+    # Ajoute au store les fichiers pas encore importés (clé : empreinte du contenu et du nom).
+    # Renvoie la liste des (nom, lignes ajoutées ou message d'erreur)
+    os.makedirs(dossier, exist_ok=True)
+    manifeste = _lire_manifeste(dossier)
+
+    fichiers = []
+    for chemin in chemins:
+        with open(chemin, "rb") as f:
+            contenu = f.read()
+        nom = os.path.basename(chemin)
+        cle = empreinte_fichier(contenu, nom)
+        if cle not in manifeste["fichiers"] and all(cle != c for c, _, _, _ in fichiers):
+            fichiers.append((cle, contenu, nom, signature_fichier(chemin)))
+
+    if deja_nettoye:
+        # Données déjà au format de l'application (ex. donnees_etudiants.xlsx)
+        resultats = []
+        for _, contenu, nom, _ in fichiers:
+            try:
+                lecteur = pd.read_csv if nom.endswith(".csv") else pd.read_excel
+                resultats.append((_colonnes_application(lecteur(io.BytesIO(contenu))), None))
+            except Exception as e:
+                resultats.append((None, e))
+    else:
+        resultats = traiter_fichiers([(contenu, nom) for _, contenu, nom, _ in fichiers], workers)
+
+    rapport = []
+    for (cle, _, nom, signature), (df, erreur) in zip(fichiers, resultats):
+        if erreur is not None:
+            rapport.append((nom, f"erreur : {erreur}"))
+            continue
+        partie = _nouvelle_partie(manifeste)
+        typer_donnees(df).to_parquet(os.path.join(dossier, partie), index=False)
+        manifeste["fichiers"][cle] = {"nom": nom, "partie": partie, "lignes": len(df), "signature": signature}
+        # Manifeste réécrit après chaque partie : un import interrompu reste cohérent
+        _ecrire_manifeste(dossier, manifeste)
+        rapport.append((nom, len(df)))
+    return rapport
+
+_verrou_actualisation = threading.Lock()
+
+def actualiser_fichier(chemin, dossier=DOSSIER_DEFAUT, deja_nettoye=False, si_importe=False):
+    # Importe chemin s'il est absent du store ou a changé depuis son import (date, taille) :
+    # la partie de l'ancienne version est alors remplacée, les autres fichiers sont gardés.
+    # si_importe : seulement si une version du fichier est déjà dans le store.
+    # Renvoie le rapport d'importer_fichiers ([] si rien n'a changé)
+    if not os.path.exists(chemin):
+        return []
+    nom = os.path.basename(chemin)
+    signature = signature_fichier(chemin)
+    # Plusieurs sessions Streamlit peuvent le demander en même temps
+    with _verrou_actualisation:
+        manifeste = _lire_manifeste(dossier)
+        versions = {cle: infos for cle, infos in manifeste["fichiers"].items() if infos["nom"] == nom}
+        if (si_importe and not versions) or any(infos.get("signature") == signature
+                                               for infos in versions.values()):
+            return []
+
+        rapport = importer_fichiers([chemin], dossier, deja_nettoye)
+        if any(isinstance(resultat, str) for _, resultat in rapport):
+            # Nouvelle version illisible : l'ancienne reste dans le store
+            return rapport
+
+        # Contenu importé (ou déjà présent si seule la date a changé) : les autres versions du
+        # fichier sont retirées du store
+        with open(chemin, "rb") as f:
+            actuelle = empreinte_fichier(f.read(), nom)
+        manifeste = _lire_manifeste(dossier)
+        manifeste["fichiers"][actuelle]["signature"] = signature
+        anciennes = [manifeste["fichiers"].pop(cle) for cle in versions if cle != actuelle]
+        _ecrire_manifeste(dossier, manifeste)
+        for infos in anciennes:
+            try:
+                os.remove(os.path.join(dossier, infos["partie"]))
+            except OSError:
+                pass
+        return rapport
+
+def charger_store(dossier=DOSSIER_DEFAUT):
+    # Lecture de toutes les parties, fusionnées et typées
+    manifeste = _lire_manifeste(dossier)
+    parties = [pd.read_parquet(os.path.join(dossier, infos["partie"]))
+               for infos in manifeste["fichiers"].values()]
+    if not parties:
+        return pd.DataFrame()
+    return typer_donnees(fusionner_donnees(parties)).reset_index(drop=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store de données Émotionnella (Parquet)")
+    sous_commandes = parser.add_subparsers(dest="commande", required=True)
+
+    cmd_import = sous_commandes.add_parser("import", help="Importer des exports .xlsx/.csv")
+    cmd_import.add_argument("fichiers", nargs="+")
+    cmd_import.add_argument("--dossier", default=DOSSIER_DEFAUT)
+    cmd_import.add_argument("--deja-nettoye", action="store_true",
+                            help="Fichiers déjà au format de l'application (pas de nettoyage)")
+    cmd_import.add_argument("--workers", type=int, default=None)
+
+    cmd_info = sous_commandes.add_parser("info", help="Résumé du contenu du store")
+    cmd_info.add_argument("--dossier", default=DOSSIER_DEFAUT)
+
+    args = parser.parse_args()
+    if args.commande == "import":
+        for nom, resultat in importer_fichiers(args.fichiers, args.dossier, args.deja_nettoye, args.workers):
+            print(f"{nom} : {resultat}")
+    else:
+        for infos in _lire_manifeste(args.dossier)["fichiers"].values():
+            print(f"{infos['partie']} : {infos['nom']} ({infos['lignes']} lignes)")
@@ -0,0 +1,115 @@
+import argparse
+import copy
+import os
+from datetime import datetime
+import joblib
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+from data_loader import traiter_fichier
+from pipeline import (CHEMIN_MODELE, chemin_version, charger_modele, dernier_modele, metadonnees_modele,
+                      versions_modele)
+
+# Variables utilisées par le modèle (même ordre que appliquer_clustering)
+COLONNES_MODELE = ["Temps utilisé (min)", "Note/20,00"]
+TAILLE_LOT = 10_000
+
+def vers_minibatch(model):
+    # Reprise d'un KMeans entraîné hors ligne : les centroïdes servent de point de départ et
+    # la taille de chaque cluster de poids, pour que les nouveaux lots ne les écrasent pas
+    if isinstance(model, MiniBatchKMeans):
+        return copy.deepcopy(model)
+    centres = model.cluster_centers_
+    if hasattr(model, "labels_"):
+        effectifs = np.bincount(model.labels_, minlength=len(centres)).astype(float)
+    else:
+        effectifs = np.ones(len(centres))
+    # reassignment_ratio=0 : un centre peu peuplé n'est jamais déplacé au hasard
+    minibatch = MiniBatchKMeans(n_clusters=len(centres), init=centres, n_init=1, reassignment_ratio=0.0,
+                                random_state=0)
+    minibatch.partial_fit(centres, sample_weight=effectifs)
+    return minibatch
+
+def lots_depuis_df(df, taille=TAILLE_LOT):
+    # Tableaux (temps, note) de taille bornée, sans lignes incomplètes
+    X = df[COLONNES_MODELE].to_numpy(dtype=float)
+    X = X[~np.isnan(X).any(axis=1)]
+    for debut in range(0, len(X), taille):
+        yield X[debut:debut + taille]
+
+def mettre_a_jour(model, scaler, lots):
+    # Mise à jour en continu du scaler (moyenne, variance) et des centroïdes, lot par lot.
+    # Le modèle chargé n'est pas modifié. Renvoie (model, scaler, nombre d'étudiants vus)
+    model = vers_minibatch(model)
+    scaler = copy.deepcopy(scaler)
+    vus = 0
+    for X in lots:
+        if not len(X):
+            continue
+        # Les centroïdes suivent le changement d'échelle avant d'apprendre du lot
+        centres = scaler.inverse_transform(model.cluster_centers_)
+        scaler.partial_fit(X)
+        model.cluster_centers_ = scaler.transform(centres)
+        model.partial_fit(scaler.transform(X))
+        vus += len(X)
+    return model, scaler, vus
+
+def enregistrer_version(model, scaler, chemin_base=CHEMIN_MODELE, parent=None, echantillons=0):
+    # Nouvel artefact clustering_model.vNNNN.pkl, au même format que le modèle d'origine
+    versions = versions_modele(chemin_base)
+    version = versions[-1][0] + 1 if versions else 1
+    chemin = chemin_version(chemin_base, version)
+    meta = metadonnees_modele(model, scaler)
+    artefact = {
+        "kmeans": model,
+        "scaler": scaler,
+        "version": version,
+        "parent": os.path.basename(parent) if parent else None,
+        "echantillons": int(echantillons),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        # Nom du groupe de chaque label du modèle, d'après les centroïdes
+        "emotions": {i: meta["noms"][cle - 1] for i, cle in enumerate(meta["cles"].tolist())},
+    }
+    tmp = chemin + ".tmp"
+    joblib.dump(artefact, tmp)
+    os.replace(tmp, chemin)
+    return chemin
+
+def entrainer(lots, chemin_base=CHEMIN_MODELE):
+    # Part de la dernière version, apprend des lots et enregistre la version suivante.
+    # Renvoie (chemin de la nouvelle version ou None si aucune donnée, étudiants vus)
+    parent = dernier_modele(chemin_base)
+    model, scaler = charger_modele(parent)
+    model, scaler, vus = mettre_a_jour(model, scaler, lots)
+    if not vus:
+        return None, 0
+    return enregistrer_version(model, scaler, chemin_base, parent, vus), vus
+
+def _lots_fichiers(chemins):
+    # Un fichier nettoyé en mémoire à la fois
+    for chemin in chemins:
+        with open(chemin, "rb") as f:
+            df = traiter_fichier(f.read(), os.path.basename(chemin))
+        print(f"{os.path.basename(chemin)} : {len(df)} étudiants")
+        yield from lots_depuis_df(df)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Réentraînement incrémental du modèle de clustering")
+    sous_commandes = parser.add_subparsers(dest="commande", required=True)
+
+    cmd_maj = sous_commandes.add_parser("mettre-a-jour", help="Apprendre d'exports .xlsx/.csv")
+    cmd_maj.add_argument("fichiers", nargs="+")
+    cmd_maj.add_argument("--modele", default=CHEMIN_MODELE)
+
+    cmd_versions = sous_commandes.add_parser("versions", help="Lister les versions du modèle")
+    cmd_versions.add_argument("--modele", default=CHEMIN_MODELE)
+
+    args = parser.parse_args()
+    if args.commande == "mettre-a-jour":
+        chemin, vus = entrainer(_lots_fichiers(args.fichiers), args.modele)
+        print(f"{vus} étudiants appris -> {chemin}" if chemin else "Aucune donnée exploitable")
+    else:
+        for version, chemin in versions_modele(args.modele):
+            artefact = joblib.load(chemin)
+            print(f"v{version:04d} : {artefact['date']}, {artefact['echantillons']} étudiants "
+                  f"(depuis {artefact['parent']})")
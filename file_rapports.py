@@ -0,0 +1,151 @@
+import contextvars
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+from instrumentation import Journal, activer, mesurer
+
+# Rapports terminés gardés sur disque ; au-delà, les moins récemment demandés sont supprimés
+TAILLE_CACHE_RAPPORTS = 32
+DOSSIER_RAPPORTS = os.path.join(os.environ.get("EMOTIONNELLA_CACHE_DIR") or tempfile.gettempdir(),
+                                "rapports_emotionnella")
+# À changer quand la mise en page de generer_pdf change : les anciens PDF ne sont plus servis
+FORMAT_RAPPORT = 1
+
+def empreinte_rapport(df, fig1, fig2, fig3=None, profil_df=None, top_students_dict=None):
+    # Clé du rapport : tout ce que generer_pdf met dans le document (nombre d'étudiants,
+    # graphiques, tableaux). Deux sessions qui demandent le même rapport obtiennent la même clé
+    h = hashlib.sha256(f"{FORMAT_RAPPORT}:{len(df)}".encode("utf-8"))
+    for fig in (fig1, fig2, fig3):
+        h.update(b"\0" if fig is None else fig.to_json().encode("utf-8"))
+    tableaux = [("profil", profil_df)] if profil_df is not None else []
+    tableaux += list((top_students_dict or {}).items())
+    for nom, tableau in tableaux:
+        h.update(f"\0{nom}:{list(tableau.columns)}".encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(tableau, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+def _generer_pdf(*args, **kwargs):
+    # pdf_generator (fpdf, Kaleido) n'est importé qu'à la première génération
+    import pdf_generator as pg
+    return pg.generer_pdf(*args, **kwargs)
+
+class FileRapports:
+    # Génération des rapports PDF en arrière-plan, partagée entre les sessions Streamlit.
+    # L'identifiant d'une tâche est la clé du rapport : une demande identique rejoint la
+    # tâche en cours ou reçoit directement le PDF du cache disque
+    def __init__(self, dossier=DOSSIER_RAPPORTS, taille_max=TAILLE_CACHE_RAPPORTS, workers=1):
+        self.dossier = dossier
+        self.taille_max = taille_max
+        # Threads : le rendu Kaleido se fait dans Chromium, hors du GIL
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rapports")
+        self._taches = {}
+        self._fichiers = OrderedDict()
+        # Étapes mesurées pendant la génération de chaque rapport terminé (journal du thread)
+        self._mesures = {}
+        self._verrou = threading.Lock()
+        os.makedirs(dossier, exist_ok=True)
+        # Rapports d'une exécution précédente, du moins au plus récemment demandé
+        for entree in sorted(os.scandir(dossier), key=lambda entree: entree.stat().st_mtime):
+            if entree.name.endswith(".pdf"):
+                self._fichiers[entree.name[:-len(".pdf")]] = entree.path
+        with self._verrou:
+            self._limiter()
+
+    def _chemin(self, cle):
+        return os.path.join(self.dossier, f"{cle}.pdf")
+
+    def _limiter(self):
+        while len(self._fichiers) > self.taille_max:
+            cle, chemin = self._fichiers.popitem(last=False)
+            self._mesures.pop(cle, None)
+            try:
+                os.remove(chemin)
+            except OSError:
+                pass
+
+    def soumettre_rapport(self, df, fig1, fig2, fig3=None, profil_df=None, top_students_dict=None):
+        # Renvoie l'identifiant de la tâche (suivi avec etat, PDF lu avec lire)
+        cle = empreinte_rapport(df, fig1, fig2, fig3, profil_df, top_students_dict)
+        return self.soumettre(cle, _generer_pdf, df, fig1, fig2, fig3=fig3, profil_df=profil_df,
+                              top_students_dict=top_students_dict)
+
+    def soumettre(self, cle, fonction, *args, **kwargs):
+        # fonction(*args, progression=..., **kwargs) renvoie le chemin d'un PDF temporaire
+        with self._verrou:
+            if cle in self._fichiers and os.path.exists(self._fichiers[cle]):
+                self._fichiers.move_to_end(cle)
+                return cle
+            tache = self._taches.get(cle)
+            if tache is not None and tache["statut"] != "erreur":
+                return cle
+            self._taches[cle] = {"statut": "en_attente", "progression": 0.0, "erreur": None}
+        self._executor.submit(self._executer, cle, fonction, args, kwargs)
+        return cle
+
+    def _executer(self, cle, fonction, args, kwargs):
+        tache = self._taches[cle]
+        tache["statut"] = "en_cours"
+
+        def progression(faits, total):
+            tache["progression"] = faits / total
+
+        def generer():
+            # Contexte propre à la tâche : les mesures de generer_pdf (rasterisation,
+            # écriture) vont dans le journal de la tâche, repris par la session
+            with mesurer("pdf.generation"):
+                return fonction(*args, progression=progression, **kwargs)
+
+        journal = Journal()
+        contexte = contextvars.copy_context()
+        contexte.run(activer, journal)
+        try:
+            temporaire = contexte.run(generer)
+            chemin = self._chemin(cle)
+            # Copie puis renommage : un PDF du cache est toujours complet
+            shutil.move(temporaire, chemin + ".tmp")
+            os.replace(chemin + ".tmp", chemin)
+        except Exception as erreur:
+            with self._verrou:
+                tache.update(statut="erreur", erreur=str(erreur))
+            return
+        with self._verrou:
+            self._fichiers[cle] = chemin
+            self._fichiers.move_to_end(cle)
+            self._mesures[cle] = journal.etapes
+            del self._taches[cle]
+            self._limiter()
+
+    def etat(self, cle):
+        # {"statut": en_attente | en_cours | termine | erreur, "progression": 0..1, "erreur",
+        # "etapes"} ; etapes : mesures de la génération (None si le PDF vient du cache disque).
+        # None si la tâche est inconnue ou son PDF déjà sorti du cache
+        with self._verrou:
+            tache = self._taches.get(cle)
+            if tache is not None:
+                return dict(tache, etapes=None)
+            chemin = self._fichiers.get(cle)
+            etapes = self._mesures.get(cle)
+        if chemin is not None and os.path.exists(chemin):
+            return {"statut": "termine", "progression": 1.0, "erreur": None, "etapes": etapes}
+        return None
+
+    def lire(self, cle):
+        # Contenu du PDF terminé (None s'il n'est plus en cache)
+        with self._verrou:
+            chemin = self._fichiers.get(cle)
+            if chemin is None:
+                return None
+            self._fichiers.move_to_end(cle)
+        try:
+            # La date du fichier garde l'ordre d'utilisation d'un redémarrage à l'autre
+            os.utime(chemin)
+            with open(chemin, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
@@ -0,0 +1,102 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Journal actif du thread courant (une session Streamlit = un thread) ; None : mesures ignorées
+_journal_actif = ContextVar("journal_actif", default=None)
+
+def memoire_residente():
+    # Mémoire résidente du processus en octets (None si indisponible sur ce système)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+class Journal:
+    # Durée, nombre de lignes et variation de mémoire de chaque étape, dans l'ordre d'exécution
+    def __init__(self):
+        self.debut = time.time()
+        self.etapes = []
+        self._niveau = 0
+
+    @contextmanager
+    def mesurer(self, nom, lignes=None):
+        # L'appelant peut renseigner mesure["lignes"] une fois le résultat connu.
+        # niveau > 0 : sous-étape (ex. pdf.rasterisation dans pdf), exclue du total
+        mesure = {"etape": nom, "niveau": self._niveau, "lignes": lignes, "duree": None, "memoire": None}
+        self.etapes.append(mesure)
+        self._niveau += 1
+        memoire = memoire_residente()
+        debut = time.perf_counter()
+        try:
+            yield mesure
+        finally:
+            mesure["duree"] = time.perf_counter() - debut
+            apres = memoire_residente()
+            if memoire is not None and apres is not None:
+                mesure["memoire"] = apres - memoire
+            self._niveau -= 1
+
+    def importer(self, etapes):
+        # Étapes mesurées dans un autre journal (ex. rapport PDF généré en arrière-plan),
+        # ajoutées à la suite au niveau courant
+        self.etapes.extend(dict(mesure, niveau=mesure["niveau"] + self._niveau) for mesure in etapes)
+
+    def total(self):
+        return sum(mesure["duree"] for mesure in self.etapes
+                   if mesure["niveau"] == 0 and mesure["duree"] is not None)
+
+    def vers_json(self):
+        return json.dumps({"debut": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.debut)),
+                           "total": self.total(), "etapes": self.etapes}, ensure_ascii=False, indent=2)
+
+    def vers_prometheus(self, prefixe="emotionnella_etape"):
+        # Format texte Prometheus : une série par étape (les étapes répétées sont cumulées)
+        cumuls = {}
+        for mesure in self.etapes:
+            if mesure["duree"] is None:
+                continue
+            cumul = cumuls.setdefault(mesure["etape"], {"duree": 0.0, "lignes": None, "memoire": None})
+            cumul["duree"] += mesure["duree"]
+            if mesure["lignes"] is not None:
+                cumul["lignes"] = mesure["lignes"]
+            if mesure["memoire"] is not None:
+                cumul["memoire"] = (cumul["memoire"] or 0) + mesure["memoire"]
+
+        series = [("duree_secondes", "duree", "Durée de l'étape (s)"),
+                  ("lignes", "lignes", "Lignes traitées par l'étape"),
+                  ("memoire_octets", "memoire", "Variation de la mémoire résidente pendant l'étape (octets)")]
+        lignes = []
+        for suffixe, champ, aide in series:
+            valeurs = [(nom, cumul[champ]) for nom, cumul in cumuls.items() if cumul[champ] is not None]
+            if not valeurs:
+                continue
+            lignes.append(f"# HELP {prefixe}_{suffixe} {aide}")
+            lignes.append(f"# TYPE {prefixe}_{suffixe} gauge")
+            for nom, valeur in valeurs:
+                etiquette = nom.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+                lignes.append(f'{prefixe}_{suffixe}{{etape="{etiquette}"}} {valeur}')
+        return "\n".join(lignes) + "\n"
+
+def activer(journal):
+    # Les appels à mesurer() du thread courant alimentent désormais ce journal
+    _journal_actif.set(journal)
+    return journal
+
+@contextmanager
+def mesurer(nom, lignes=None):
+    # Mesure d'une étape dans le journal actif ; sans journal (traitement par lots), rien n'est enregistré
+    journal = _journal_actif.get()
+    if journal is None:
+        yield {"etape": nom, "lignes": lignes}
+        return
+    with journal.mesurer(nom, lignes) as mesure:
+        yield mesure
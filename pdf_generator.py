@@ -1,17 +1,259 @@
+import fpdf.fpdf
 from fpdf import FPDF
+from fpdf.ttfonts import TTFontFile
+from PIL import Image
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import hashlib
+import io
+import queue
+import re
 import tempfile
+import threading
 import os
 import uuid
+import zlib
+
+from instrumentation import mesurer
+
+# PDF.ajouter_police (structure de self.fonts et self.font_files, glyphes de départ du
+# sous-ensemble) et PDF._putfonts (TTFontFile lu dans le module fpdf.fpdf) reprennent des
+# détails internes de fpdf 1.7.2, la version de requirements.txt
+if fpdf.FPDF_VERSION != "1.7.2":
+    raise ImportError(f"pdf_generator nécessite fpdf 1.7.2 (version installée : {fpdf.FPDF_VERSION})")
+
+# --- Rendu des graphiques en PNG ---
+TAILLE_CACHE_IMAGES = 64
+RENDUS_PARALLELES = 3
+
+_cache_images = OrderedDict()
+_verrou_images = threading.Lock()
+_scopes = queue.Queue()
+_nb_scopes = 0
+_verrou_scopes = threading.Lock()
+
+@lru_cache(maxsize=None)
+def _classe_scope():
+    # Kaleido n'est importé qu'au premier rendu
+    try:
+        from kaleido.scopes.plotly import PlotlyScope
+    except ImportError:
+        return None
+    return PlotlyScope
+
+def _prendre_scope():
+    # Chaque scope Kaleido a son propre Chromium : un scope par rendu simultané
+    global _nb_scopes
+    try:
+        return _scopes.get_nowait()
+    except queue.Empty:
+        pass
+    with _verrou_scopes:
+        if _nb_scopes < RENDUS_PARALLELES:
+            import plotly.io as pio
+            scope = _classe_scope()(plotlyjs=pio.kaleido.scope.plotlyjs, mathjax=pio.kaleido.scope.mathjax)
+            # Compté une fois créé : un échec (Chromium absent) ne bloque pas la place
+            _nb_scopes += 1
+            return scope
+    return _scopes.get()
+
+def _rendre_png(fig):
+    if _classe_scope() is None:
+        return fig.to_image(format="png")
+    scope = _prendre_scope()
+    try:
+        return scope.transform(fig, format="png")
+    finally:
+        _scopes.put(scope)
+
+def rasteriser(figures):
+    # PNG (bytes) de chaque figure : rendus en parallèle, mis en cache selon le JSON de la figure
+    cles = [hashlib.sha256(fig.to_json().encode("utf-8")).hexdigest() for fig in figures]
+    with _verrou_images:
+        images = [_cache_images.get(cle) for cle in cles]
+    a_rendre = {cle: fig for cle, fig, png in zip(cles, figures, images) if png is None}
+
+    if a_rendre:
+        with ThreadPoolExecutor(max_workers=min(len(a_rendre), RENDUS_PARALLELES)) as executor:
+            rendus = dict(zip(a_rendre, executor.map(_rendre_png, a_rendre.values())))
+        with _verrou_images:
+            for cle, png in rendus.items():
+                _cache_images[cle] = png
+            while len(_cache_images) > TAILLE_CACHE_IMAGES:
+                _cache_images.popitem(last=False)
+        images = [png if png is not None else rendus[cle] for cle, png in zip(cles, images)]
+    else:
+        with _verrou_images:
+            for cle in cles:
+                _cache_images.move_to_end(cle)
+    return images
+
+@lru_cache(maxsize=TAILLE_CACHE_IMAGES)
+def _decoder_png(png):
+    # Pixels RGB compressés pour FPDF (transparence aplatie sur fond blanc)
+    img = Image.open(io.BytesIO(png))
+    if img.mode != "RGB":
+        img = img.convert("RGBA")
+        fond = Image.new("RGB", img.size, "white")
+        fond.paste(img, mask=img.getchannel("A"))
+        img = fond
+    return img.width, img.height, zlib.compress(img.tobytes())
+
+# --- Polices ---
+# Chemins relatifs au module : la génération fonctionne quel que soit le dossier courant
+DOSSIER_POLICES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+POLICES = {'': "DejaVuSans.ttf", 'B': "DejaVuSans-Bold.ttf"}
+TAILLE_CACHE_SOUS_ENSEMBLES = 32
+
+@lru_cache(maxsize=None)
+def _metriques_police(chemin):
+    # Analyse du TTF une seule fois par processus, sans fichier .pkl écrit à côté de la police
+    ttf = TTFontFile()
+    ttf.getMetrics(chemin)
+    return {
+        'type': 'TTF',
+        'name': re.sub('[ ()]', '', ttf.fullName),
+        'desc': {
+            'Ascent': int(round(ttf.ascent, 0)),
+            'Descent': int(round(ttf.descent, 0)),
+            'CapHeight': int(round(ttf.capHeight, 0)),
+            'Flags': ttf.flags,
+            'FontBBox': "[%s %s %s %s]" % tuple(int(round(v, 0)) for v in ttf.bbox),
+            'ItalicAngle': int(ttf.italicAngle),
+            'StemV': int(round(ttf.stemV, 0)),
+            'MissingWidth': int(round(ttf.defaultWidth, 0)),
+        },
+        'up': round(ttf.underlinePosition),
+        'ut': round(ttf.underlineThickness),
+        'cw': ttf.charWidths,
+        'ttffile': chemin,
+        'originalsize': os.stat(chemin).st_size,
+    }
+
+_sous_ensembles = OrderedDict()
+_verrou_sous_ensembles = threading.Lock()
+
+class _PoliceSousEnsemble(TTFontFile):
+    # FPDF relit le TTF et reconstruit le sous-ensemble de glyphes à chaque output() :
+    # les sous-ensembles déjà construits sont réutilisés d'un PDF à l'autre. Les glyphes
+    # sont dédoublonnés et triés : le même jeu de caractères donne le même sous-ensemble
+    # quel que soit l'ordre d'apparition dans le texte
+    def makeSubset(self, file, subset):
+        cle = (file, tuple(sorted(set(subset))))
+        with _verrou_sous_ensembles:
+            resultat = _sous_ensembles.get(cle)
+            if resultat is not None:
+                _sous_ensembles.move_to_end(cle)
+        if resultat is None:
+            flux = super().makeSubset(file, list(cle[1]))
+            resultat = (flux, self.codeToGlyph, self.maxUni)
+            with _verrou_sous_ensembles:
+                _sous_ensembles[cle] = resultat
+                while len(_sous_ensembles) > TAILLE_CACHE_SOUS_ENSEMBLES:
+                    _sous_ensembles.popitem(last=False)
+        flux, self.codeToGlyph, self.maxUni = resultat
+        return flux
+
+# FPDF._putfonts crée ses TTFontFile depuis le module fpdf.fpdf : _PoliceSousEnsemble y
+# est placée le temps de l'intégration des polices d'un PDF de ce module seulement
+_verrou_putfonts = threading.Lock()
 
 # --- PDF Generator class ---
 class PDF(FPDF):
     def __init__(self):
         super().__init__()
         # Ajouter une police Unicode personnalisée
-        self.add_font('DejaVu', '', 'fonts/DejaVuSans.ttf', uni=True)
-        self.add_font('DejaVu', 'B', 'fonts/DejaVuSans-Bold.ttf', uni=True)
+        for style, fichier in POLICES.items():
+            self.ajouter_police('DejaVu', style, os.path.join(DOSSIER_POLICES, fichier))
         self.set_font('DejaVu', 'B', 16)
+
+    # Équivalent de add_font(..., uni=True) de fpdf 1.7.2 avec les métriques partagées par
+    # tous les PDF du processus ; seuls les glyphes utilisés sont intégrés au document
+    def ajouter_police(self, famille, style, chemin):
+        cle = famille.lower() + style
+        if cle in self.fonts:
+            return
+        metriques = _metriques_police(chemin)
+        self.fonts[cle] = {
+            'i': len(self.fonts) + 1, 'type': metriques['type'], 'name': metriques['name'],
+            'desc': metriques['desc'], 'up': metriques['up'], 'ut': metriques['ut'],
+            'cw': metriques['cw'], 'ttffile': chemin, 'fontkey': cle,
+            'subset': list(range(57 if hasattr(self, 'str_alias_nb_pages') else 32)),
+            'unifilename': None,
+        }
+        self.font_files[cle] = {'length1': metriques['originalsize'], 'type': 'TTF', 'ttffile': chemin}
+        self.font_files[chemin] = {'type': 'TTF'}
+
+    # Intégration des polices avec les sous-ensembles de glyphes mis en cache. Verrou : des
+    # PDF sont écrits dans plusieurs threads (file des rapports), la classe d'origine est
+    # remise après chaque appel
+    def _putfonts(self):
+        with _verrou_putfonts:
+            fpdf.fpdf.TTFontFile = _PoliceSousEnsemble
+            try:
+                super()._putfonts()
+            finally:
+                fpdf.fpdf.TTFontFile = TTFontFile
+
+    # Table des largeurs : FPDF cherche chaque caractère de la police dans la liste des
+    # glyphes utilisés, un set rend la recherche immédiate
+    def _putTTfontwidths(self, font, maxUni):
+        super()._putTTfontwidths(dict(font, subset=set(font['subset'])), maxUni)
     
+    # Image PNG en mémoire : FPDF 1.7 ne sait lire que des fichiers
+    def image_png(self, png, w=0, h=0):
+        nom = "png:" + hashlib.sha1(png).hexdigest()
+        if nom not in self.images:
+            largeur, hauteur, data = _decoder_png(png)
+            self.images[nom] = {'w': largeur, 'h': hauteur, 'cs': 'DeviceRGB', 'bpc': 8,
+                                'f': 'FlateDecode', 'data': data, 'i': len(self.images) + 1}
+        self.image(nom, w=w, h=h)
+
+    # Tableau avec retour à la ligne dans les cellules : la hauteur de chaque ligne est
+    # mesurée avec les métriques de la police du document, l'en-tête est répété après
+    # chaque saut de page
+    def tableau(self, entetes, lignes, largeurs, hauteur_ligne=6, alignements=None,
+                taille_entete=9, taille_texte=8):
+        alignements = alignements or ['L'] * len(entetes)
+        famille = self.font_family
+
+        def entete():
+            self.set_font(famille, 'B', taille_entete)
+            self._ligne_tableau(entetes, largeurs, hauteur_ligne, ['C'] * len(entetes))
+            self.set_font(famille, '', taille_texte)
+
+        entete()
+        for ligne in lignes:
+            self._ligne_tableau([str(texte) for texte in ligne], largeurs, hauteur_ligne, alignements, entete)
+
+    def _ligne_tableau(self, textes, largeurs, hauteur_ligne, alignements, entete=None):
+        # Découpage sans dessin (split_only) pour connaître le nombre de lignes de chaque cellule
+        nb_lignes = [len(self.multi_cell(w, hauteur_ligne, texte, 0, 'L', split_only=True)) or 1
+                     for w, texte in zip(largeurs, textes)]
+        hauteur = hauteur_ligne * max(nb_lignes)
+
+        if self.get_y() + hauteur > self.page_break_trigger:
+            self.add_page()
+            if entete is not None:
+                entete()
+
+        x_start = self.get_x()
+        y_start = self.get_y()
+        x = x_start
+        for texte, w, align, n in zip(textes, largeurs, alignements, nb_lignes):
+            self.set_xy(x, y_start)
+            if n == 1:
+                # Texte centré verticalement sur toute la hauteur de la ligne
+                self.cell(w, hauteur, texte, 1, 0, align)
+            else:
+                self.rect(x, y_start, w, hauteur)
+                self.multi_cell(w, hauteur_ligne, texte, 0, align)
+            x += w
+
+        # Replacer le curseur à gauche pour la prochaine ligne
+        self.set_xy(x_start, y_start + hauteur)
+
     # Ajout d'une méthode pour gérer les cellules multilignes avec texte long
     def multi_cell_with_wrap(self, w, h, txt, border=0, align='L', fill=False):
         # Enregistrer la position x de départ
@@ -31,16 +273,56 @@ class PDF(FPDF):
         # Rétablir la police d'origine
         self.set_font(current_font, current_style, current_size)
 
-def generer_pdf(df, fig1, fig2, fig3=None, profil_df=None, top_students_dict=None):
-    temp_dir = tempfile.gettempdir()
-    file1_path = os.path.join(temp_dir, f"{uuid.uuid4()}.png")
-    file2_path = os.path.join(temp_dir, f"{uuid.uuid4()}.png")
-    file3_path = os.path.join(temp_dir, f"{uuid.uuid4()}.png") if fig3 is not None else None
+    # Barres groupées dessinées directement dans le PDF (pas de rendu Kaleido) : utilisé
+    # pour les rapports individuels générés par milliers
+    def barres_comparaison(self, etiquettes, series, largeur=180, hauteur=70):
+        x0 = self.get_x() + 10
+        y0 = self.get_y()
+        largeur -= 10
+        y_max = max(1.0, max((max(valeurs, default=0) for _, valeurs, _ in series), default=0))
 
-    fig1.write_image(file1_path)
-    fig2.write_image(file2_path)
-    if fig3 is not None:
-        fig3.write_image(file3_path)
+        # Grille horizontale et graduations
+        self.set_font(self.font_family, '', 6)
+        self.set_draw_color(220, 220, 220)
+        for k in range(5):
+            valeur = y_max * k / 4
+            y = y0 + hauteur - hauteur * k / 4
+            self.line(x0, y, x0 + largeur, y)
+            self.set_xy(x0 - 10, y - 2)
+            self.cell(9, 4, f"{valeur:.2f}", 0, 0, 'R')
+        self.set_draw_color(0, 0, 0)
+
+        # Une colonne par étiquette, une barre par série
+        pas = largeur / max(len(etiquettes), 1)
+        largeur_barre = pas * 0.8 / max(len(series), 1)
+        for i, etiquette in enumerate(etiquettes):
+            for j, (_, valeurs, couleur) in enumerate(series):
+                h = hauteur * valeurs[i] / y_max
+                if h > 0:
+                    self.set_fill_color(*couleur)
+                    self.rect(x0 + i * pas + pas * 0.1 + j * largeur_barre, y0 + hauteur - h, largeur_barre, h, 'F')
+            self.set_xy(x0 + i * pas, y0 + hauteur + 1)
+            self.cell(pas, 3, etiquette, 0, 0, 'C')
+
+        # Légende
+        self.set_xy(x0, y0 + hauteur + 5)
+        for nom, _, couleur in series:
+            self.set_fill_color(*couleur)
+            self.rect(self.get_x(), self.get_y() + 1, 3, 3, 'F')
+            self.set_x(self.get_x() + 4)
+            self.cell(self.get_string_width(nom) + 6, 5, nom)
+        self.set_fill_color(255, 255, 255)
+        self.set_xy(x0 - 10, y0 + hauteur + 12)
+
+def generer_pdf(df, fig1, fig2, fig3=None, profil_df=None, top_students_dict=None, progression=None):
+    # progression(faits, total) est appelé après chaque étape : graphiques, mise en page, écriture
+    temp_dir = tempfile.gettempdir()
+    # Rendu simultané des graphiques, gardés en mémoire
+    figures = [fig for fig in (fig1, fig2, fig3) if fig is not None]
+    with mesurer("pdf.rasterisation", lignes=len(figures)):
+        images = rasteriser(figures)
+    if progression is not None:
+        progression(1, 3)
 
     pdf = PDF()
     pdf.add_page()
@@ -51,13 +333,13 @@ def generer_pdf(df, fig1, fig2, fig3=None, profil_df=None, top_students_dict=Non
     pdf.ln(10)
     pdf.cell(200, 10, f"Nombre total d'étudiants : {len(df)}", ln=True)
 
-    pdf.image(file1_path, w=180)
+    pdf.image_png(images[0], w=180)
     pdf.add_page()
-    pdf.image(file2_path, w=180)
+    pdf.image_png(images[1], w=180)
     
     if fig3 is not None:
         pdf.add_page()
-        pdf.image(file3_path, w=180)
+        pdf.image_png(images[2], w=180)
     
     # Ajouter le tableau des profils de clusters au PDF
     if profil_df is not None:
@@ -66,49 +348,12 @@ def generer_pdf(df, fig1, fig2, fig3=None, profil_df=None, top_students_dict=Non
         pdf.cell(200, 10, "Profil des Clusters", ln=True)
         pdf.ln(5)
 
-        # Largeurs des colonnes
-        col_widths = [45, 25, 25, 30, 55]
-        row_height = 6
-
-        # En-têtes du tableau
-        pdf.set_font("DejaVu", "B", 9)
         headers = ["Nom du groupe", "N° étudiants", "Moy. note", "Moy. temps min", "Caractéristique"]
-        for i, header in enumerate(headers):
-            pdf.cell(col_widths[i], row_height, header, 1, 0, "C")
-        pdf.ln(row_height)
-
-        # Contenu du tableau
-        pdf.set_font("DejaVu", "", 8)
-        for _, row in profil_df.iterrows():
-            # Sauvegarder la position de départ
-            x_start = pdf.get_x()
-            y_start = pdf.get_y()
-
-            # Cellule multi-ligne temporaire pour estimer la hauteur nécessaire
-            tmp_pdf = FPDF()
-            tmp_pdf.add_page()
-            tmp_pdf.add_font('DejaVu', '', 'fonts/DejaVuSans.ttf', uni=True)
-            tmp_pdf.set_font("DejaVu", "", 8)
-            tmp_pdf.set_xy(0, 0)
-            tmp_pdf.multi_cell(col_widths[4], row_height, str(row["Caractéristique principale"]))
-            cell_height = tmp_pdf.get_y()
-
-            max_height = max(row_height, cell_height)
-
-            # Repositionnement pour dessiner les autres cellules à la même hauteur
-            pdf.set_xy(x_start, y_start)
-            pdf.cell(col_widths[0], max_height, str(row["Nom du groupe"]), 1)
-            pdf.cell(col_widths[1], max_height, str(row["Nombre d'étudiants"]), 1, 0, "C")
-            pdf.cell(col_widths[2], max_height, str(row["Note moyenne"]), 1, 0, "C")
-            pdf.cell(col_widths[3], max_height, str(row["Temps moyen (min)"]), 1, 0, "C")
-
-            # Dernière cellule multi-ligne
-            x = pdf.get_x()
-            y = pdf.get_y()
-            pdf.multi_cell(col_widths[4], row_height, str(row["Caractéristique principale"]), 1)
-            
-            # Replacer le curseur à gauche pour la prochaine ligne
-            pdf.set_xy(x_start, y_start + max_height)
+        colonnes = ["Nom du groupe", "Nombre d'étudiants", "Note moyenne", "Temps moyen (min)",
+                    "Caractéristique principale"]
+        pdf.tableau(headers, profil_df[colonnes].astype(str).values.tolist(),
+                    largeurs=[45, 25, 25, 30, 55], hauteur_ligne=6,
+                    alignements=["L", "C", "C", "C", "L"])
 
 
     # Ajouter les Top 5 Étudiants par Filière
@@ -130,30 +375,74 @@ def generer_pdf(df, fig1, fig2, fig3=None, profil_df=None, top_students_dict=Non
 
             # Largeurs approximatives pour chaque colonne
             col_widths = [60, 30, 40, 50][:len(columns)]
-            row_height = 7
-
-            pdf.set_font("DejaVu", "B", 9)
-            for i, col in enumerate(columns):
-                pdf.cell(col_widths[i], row_height, col, 1, 0, "C")
-            pdf.ln(row_height)
-
-            pdf.set_font("DejaVu", "", 8)
-            for _, row in students_df.iterrows():
-                for i, col in enumerate(columns):
-                    text = str(row[col]) if col in row else ""
-                    pdf.cell(col_widths[i], row_height, text[:40], 1)  # Troncature éventuelle
-                pdf.ln(row_height)
+            # Colonne absente de l'export (ex. pas de temps) : cellules vides
+            valeurs = [students_df[col].astype(str).tolist() if col in students_df.columns
+                       else [""] * len(students_df) for col in columns]
+            pdf.tableau(columns, [list(ligne) for ligne in zip(*valeurs)],
+                        largeurs=col_widths, hauteur_ligne=7)
 
             pdf.ln(4)
 
 
     pdf_output_path = os.path.join(temp_dir, f"{uuid.uuid4()}.pdf")
-    pdf.output(pdf_output_path)
+    if progression is not None:
+        progression(2, 3)
+    # Écriture : sous-ensembles de polices et compression des pages
+    with mesurer("pdf.ecriture"):
+        pdf.output(pdf_output_path)
+    if progression is not None:
+        progression(3, 3)
 
-    # Nettoyer les fichiers temporaires
-    os.remove(file1_path)
-    os.remove(file2_path)
-    if fig3 is not None:
-        os.remove(file3_path)
+    return pdf_output_path
+
+# Couleurs par défaut de Plotly, comme le graphique de comparaison de l'application
+COULEURS_COMPARAISON = [(99, 110, 250), (239, 85, 59)]
+
+def generer_pdf_etudiant(nom, infos, questions=None, scores=None, moyennes=None, profil=None):
+    # Rapport individuel renvoyé en bytes (pas de fichier temporaire) :
+    # infos = [(libellé, valeur)], profil = (titre, résumé, constats, recommandations)
+    pdf = PDF()
+    pdf.add_page()
+    pdf.set_font("DejaVu", "B", 16)
+    pdf.cell(190, 10, "Rapport individuel Émotionnella", ln=True, align="C")
+    pdf.set_font("DejaVu", "B", 13)
+    pdf.cell(190, 10, nom, ln=True, align="C")
+    pdf.ln(4)
+
+    pdf.set_font("DejaVu", "", 11)
+    for libelle, valeur in infos:
+        pdf.cell(50, 7, f"{libelle} :")
+        pdf.cell(140, 7, str(valeur), ln=True)
+
+    if questions:
+        pdf.ln(6)
+        pdf.set_font("DejaVu", "B", 13)
+        pdf.cell(190, 10, "Performance par Question", ln=True)
+        pdf.set_font("DejaVu", "", 8)
+        pdf.cell(190, 5, "Score (0 = Faux, 1 = Correct)", ln=True)
+        etiquettes = [q.replace("Q.", "").strip() for q in questions]
+        series = [("Score Étudiant", scores, COULEURS_COMPARAISON[0])]
+        if moyennes is not None:
+            series.append(("Moyenne Filière", moyennes, COULEURS_COMPARAISON[1]))
+        pdf.barres_comparaison(etiquettes, series)
+
+    if profil is not None:
+        titre, resume, constats, recommandations = profil
+        pdf.ln(6)
+        pdf.set_font("DejaVu", "B", 13)
+        pdf.cell(190, 10, "Analyse et Recommandations", ln=True)
+        pdf.set_font("DejaVu", "B", 11)
+        pdf.cell(190, 7, f"État émotionnel détecté : {titre}", ln=True)
+        pdf.set_font("DejaVu", "", 10)
+        pdf.multi_cell(190, 6, resume)
+        for constat in constats:
+            pdf.multi_cell(190, 6, f"- {constat}")
+        pdf.ln(2)
+        pdf.set_font("DejaVu", "B", 10)
+        pdf.cell(190, 6, "Recommandations :", ln=True)
+        pdf.set_font("DejaVu", "", 10)
+        for recommandation in recommandations:
+            pdf.multi_cell(190, 6, f"- {recommandation}")
 
-    return pdf_output_path
\ No newline at end of file
+    # FPDF 1.7 renvoie le document sous forme de str latin-1
+    return pdf.output(dest='S').encode('latin-1')
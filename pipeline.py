@@ -0,0 +1,735 @@
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# joblib/scikit-learn, plotly.express et pdf_generator (fpdf, Kaleido) sont importés dans les
+# fonctions qui les utilisent : l'application affiche ses premiers éléments sans les charger
+from data_cleaning import nettoyer_donnees
+from data_loader import fusionner_donnees, lire_fichier, nombre_workers, traiter_fichier
+
+# Mappage des clusters aux émotions
+LEGENDES_EMOTIONS = {
+    1: "Confiant(e) mais prenant son temps",
+    2: "Stressé(e)",
+    3: "Frustré(e) ou abandonné(e)",
+    4: "Confiant(e) rapide"
+}
+
+# Mappage des couleurs selon l'émotion du cluster
+COULEURS_CLUSTERS = {
+    "Confiant(e) mais prenant son temps": "#FFABAB",  # Rose clair
+    "Stressé(e)": "#83C9FF",  # Bleu clair
+    "Frustré(e) ou abandonné(e)": "#0068C9",  # Bleu foncé
+    "Confiant(e) rapide": "#FF2B2B"  # Rouge vif
+}
+
+# Analyse affichée pour chaque émotion (application et rapports individuels)
+PROFILS_EMOTIONS = {
+    "Confiant(e) rapide": {
+        "emoji": "😊",
+        "titre": "Confiant(e) et rapide",
+        "resume": "Cet étudiant démontre une excellente maîtrise du sujet et une gestion efficace du temps.",
+        "constats": ["Ses performances sont excellentes, avec une note de {note:.2f}/20",
+                     "Son rythme rapide indique une grande confiance dans ses réponses"],
+        "recommandations": ["Continuer à maintenir cette efficacité",
+                            "Peut être encouragé à approfondir d'autres sujets avancés",
+                            "Pourrait aider les autres étudiants en difficulté (tutorat)"],
+    },
+    "Confiant(e) mais prenant son temps": {
+        "emoji": "🙂",
+        "titre": "Confiant(e) mais prenant son temps",
+        "resume": "Cet étudiant montre une bonne maîtrise du sujet mais préfère travailler avec prudence.",
+        "constats": ["Sa note de {note:.2f}/20 reflète une bonne compréhension",
+                     "Son temps de travail plus long suggère une approche méticuleuse"],
+        "recommandations": ["Travailler sur la gestion du temps tout en maintenant la qualité",
+                            "Exercices avec contraintes de temps pour améliorer la rapidité",
+                            "Garder confiance dans ses premières réponses"],
+    },
+    "Stressé(e)": {
+        "emoji": "😰",
+        "titre": "Stressé(e)",
+        "resume": "Cet étudiant montre des signes de stress pendant l'examen.",
+        "constats": ["Sa note de {note:.2f}/20 pourrait être améliorée",
+                     "Son temps de réponse et ses résultats suggèrent une anxiété de performance"],
+        "recommandations": ["Techniques de gestion du stress (respiration)",
+                            "Plus d'exercices pratiques dans des conditions d'examen",
+                            "Établir un plan de révision progressif",
+                            "Envisager des séances de tutorat ou des sessions de questions-réponses"],
+    },
+    "Frustré(e) ou abandonné(e)": {
+        "emoji": "😣",
+        "titre": "Frustré(e) ou ayant abandonné",
+        "resume": "Cet étudiant semble avoir rencontré des difficultés importantes pendant l'examen.",
+        "constats": ["Sa note de {note:.2f}/20 indique des lacunes à combler",
+                     "Son comportement suggère un possible abandon ou une grande frustration"],
+        "recommandations": ["Identifier les concepts fondamentaux à réviser",
+                            "Prévoir des sessions de rattrapage ciblées",
+                            "Envisager un accompagnement personnalisé",
+                            "Travailler sur la confiance et la persévérance face aux difficultés"],
+    },
+}
+
+# Au-delà de ce nombre de lignes, graphiques agrégés et aperçu paginé
+SEUIL_AGREGATION = int(os.environ.get("EMOTIONNELLA_SEUIL_AGREGATION", 100_000))
+CASES_NUAGE = 80
+
+def grand_jeu(df):
+    return len(df) > SEUIL_AGREGATION
+
+# --- Mesure du temps par étape ---
+@contextmanager
+def etape(timings, nom):
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[nom] = timings.get(nom, 0.0) + time.perf_counter() - debut
+
+# --- Modèle de clustering ---
+CHEMIN_MODELE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "clustering_model.pkl")
+
+@lru_cache(maxsize=None)
+def charger_modele(chemin="clustering_model.pkl"):
+    import joblib
+    from sklearn.preprocessing import StandardScaler
+    model_dict = joblib.load(chemin)
+    return model_dict["kmeans"], model_dict.get("scaler", StandardScaler())
+
+# Versions réentraînées enregistrées à côté du modèle d'origine : clustering_model.v0001.pkl, ...
+def chemin_version(chemin_base, version):
+    return f"{os.path.splitext(chemin_base)[0]}.v{version:04d}.pkl"
+
+def versions_modele(chemin_base=CHEMIN_MODELE):
+    racine = os.path.splitext(os.path.basename(chemin_base))[0]
+    motif = re.compile(re.escape(racine) + r"\.v(\d{4,})\.pkl$")
+    dossier = os.path.dirname(os.path.abspath(chemin_base))
+    versions = [(int(m.group(1)), os.path.join(dossier, nom))
+                for nom in os.listdir(dossier) for m in [motif.match(nom)] if m]
+    return sorted(versions)
+
+def dernier_modele(chemin_base=CHEMIN_MODELE):
+    versions = versions_modele(chemin_base)
+    return versions[-1][1] if versions else chemin_base
+
+def emotions_centroides(centres, reference):
+    # Clé de LEGENDES_EMOTIONS de chaque centroïde (temps, note en unités d'origine), d'après
+    # sa position et non son numéro. Avec 4 clusters : les deux meilleures notes sont confiantes
+    # (la plus lente « prenant son temps »), les deux autres stressée (la plus lente) ou frustrée.
+    # Sinon : quadrant du centroïde par rapport à la moyenne des données d'entraînement
+    temps, notes = centres[:, 0], centres[:, 1]
+    if len(centres) == 4:
+        cles = np.empty(4, dtype=np.int8)
+        par_note = np.argsort(notes, kind="stable")
+        for groupe, (lent, rapide) in ((par_note[2:], (1, 4)), (par_note[:2], (2, 3))):
+            plus_lent, plus_rapide = groupe[np.argsort(-temps[groupe], kind="stable")]
+            cles[plus_lent], cles[plus_rapide] = lent, rapide
+        return cles
+    lent = temps >= reference[0]
+    return np.where(notes >= reference[1], np.where(lent, 1, 4), np.where(lent, 2, 3)).astype(np.int8)
+
+# --- Étapes de l'analyse ---
+def anonymiser_nom(nom_complet):
+    parts = nom_complet.split()
+    if len(parts) >= 2:
+        return f"{parts[0]} {parts[1][0]}."
+    return nom_complet
+
+def anonymiser_noms(noms):
+    # anonymiser_nom appliqué une seule fois par nom distinct (codes de factorize, ou ceux de
+    # la colonne si elle est déjà catégorielle). Renvoie une nouvelle Series, noms n'est pas modifié
+    if isinstance(noms.dtype, pd.CategoricalDtype):
+        codes, uniques = noms.cat.codes.to_numpy(), noms.cat.categories
+    else:
+        codes, uniques = pd.factorize(noms)
+    table = np.empty(len(uniques) + 1, dtype=object)
+    table[:-1] = [anonymiser_nom(nom) for nom in uniques]
+    # Dernière case : noms manquants (code -1)
+    table[-1] = np.nan
+    return pd.Series(table[codes], index=noms.index, name=noms.name)
+
+def anonymiser(df, noms=None):
+    # Vue de df avec "Nom Complet" anonymisé (noms : résultat de anonymiser_noms déjà calculé).
+    # df garde la colonne identifiable ; les autres colonnes sont partagées, pas copiées
+    if "Nom Complet" not in df.columns:
+        return df
+    if noms is None:
+        noms = anonymiser_noms(df["Nom Complet"])
+    with pd.option_context("mode.copy_on_write", True):
+        return df.assign(**{"Nom Complet": noms})
+
+def figure_notes(df, agrege=None):
+    # Boxplot de la note par filière
+    import plotly.express as px
+    if agrege is None:
+        agrege = grand_jeu(df)
+    if agrege:
+        return figure_notes_agregee(df)
+    return px.box(df, x="Filière", y="Note/20,00", color="Filière")
+
+def figure_notes_agregee(df):
+    # Mêmes boîtes que px.box, à partir des quartiles calculés ici : seules les statistiques
+    # de chaque filière sont envoyées au navigateur (pas les points aberrants)
+    import plotly.express as px
+    notes = df["Note/20,00"].astype(float)
+    groupes = notes.groupby(df["Filière"], observed=True, sort=False)
+    stats = groupes.quantile([0.25, 0.5, 0.75]).unstack()
+    ecart = 1.5 * (stats[0.75] - stats[0.25])
+
+    # Moustaches : valeurs extrêmes comprises dans 1,5 écart interquartile
+    filiere = df["Filière"]
+    bas = filiere.map(stats[0.25] - ecart).astype(float)
+    haut = filiere.map(stats[0.75] + ecart).astype(float)
+    stats["min"] = notes.where(notes >= bas).groupby(filiere, observed=True, sort=False).min()
+    stats["max"] = notes.where(notes <= haut).groupby(filiere, observed=True, sort=False).max()
+
+    fig = go.Figure()
+    couleurs = px.colors.qualitative.Plotly
+    for i, (nom, ligne) in enumerate(stats.iterrows()):
+        fig.add_trace(go.Box(name=str(nom), x=[str(nom)], q1=[ligne[0.25]], median=[ligne[0.5]],
+                             q3=[ligne[0.75]], lowerfence=[ligne["min"]], upperfence=[ligne["max"]],
+                             marker_color=couleurs[i % len(couleurs)], legendgroup=str(nom)))
+    fig.update_layout(xaxis_title="Filière", yaxis_title="Note/20,00", legend_title_text="Filière")
+    return fig
+
+def figure_reussite(df, question_cols, moyennes=None):
+    # Bar chart du taux de réussite par question (moyennes : déjà calculées, voir moyennes_selection)
+    import plotly.express as px
+    if moyennes is None:
+        moyennes = df[question_cols].mean()
+    taux_reussite = moyennes * 100
+    taux_df = taux_reussite.reset_index()
+    taux_df.columns = ["Question", "Taux de Réussite (%)"]
+
+    return px.bar(
+        taux_df,
+        x="Question",
+        y="Taux de Réussite (%)",
+        color="Taux de Réussite (%)",
+        color_continuous_scale="Blues"
+    )
+
+# Fonction pour obtenir les 5 meilleurs étudiants par filière
+def get_top_students(dataframe, n=5):
+    # Un seul tri global puis les n premiers de chaque filière
+    top = (dataframe.sort_values(by="Note/20,00", ascending=False, kind="stable")
+           .groupby("Filière", sort=False, observed=True)
+           .head(n))
+    groupes = dict(tuple(top.groupby("Filière", sort=False, observed=True)))
+
+    # Filières dans leur ordre d'apparition, comme les onglets de l'application
+    return {filiere: groupes[filiere] for filiere in pd.unique(dataframe["Filière"]) if filiere in groupes}
+
+# --- Prédictions mises en cache entre les reruns ---
+_predictions = OrderedDict()
+_verrou_predictions = threading.Lock()
+TAILLE_CACHE_PREDICTIONS = 32
+
+def empreinte_modele(model, scaler):
+    # Identité du modèle : centroïdes et statistiques du scaler
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(model.cluster_centers_).tobytes())
+    for attribut in ("mean_", "scale_"):
+        valeur = getattr(scaler, attribut, None)
+        if valeur is not None:
+            h.update(np.ascontiguousarray(valeur).tobytes())
+    return h.hexdigest()
+
+# --- Métadonnées du modèle, calculées une fois par modèle ---
+_metadonnees = {}
+
+def metadonnees_modele(model, scaler):
+    # Numéro, nom, émotion et caractéristique de chaque cluster, déduits des centroïdes
+    # en unités d'origine. Les clusters sont numérotés 1..K dans l'ordre des émotions
+    # (LEGENDES_EMOTIONS) puis des notes décroissantes : avec K = 4, numéro = clé de l'émotion
+    empreinte = empreinte_modele(model, scaler)
+    with _verrou_predictions:
+        meta = _metadonnees.get(empreinte)
+    if meta is not None:
+        return meta
+
+    centres = scaler.inverse_transform(model.cluster_centers_)
+    reference = getattr(scaler, "mean_", centres.mean(axis=0))
+    emotions = emotions_centroides(centres, reference)
+    ordre = np.lexsort((-centres[:, 1], emotions))
+
+    # Table label KMeans -> numéro de cluster (1..K)
+    cles = np.empty(len(centres), dtype=np.int8)
+    cles[ordre] = np.arange(1, len(centres) + 1)
+    emotions = emotions[ordre]
+    centres = centres[ordre]
+
+    categories = [LEGENDES_EMOTIONS[cle] for cle in sorted(set(emotions.tolist()))]
+    noms = [LEGENDES_EMOTIONS[cle] for cle in emotions.tolist()]
+    # Plusieurs clusters avec la même émotion (K > 4) : numérotés dans le nom du groupe
+    noms = [f"{nom} ({noms[:i].count(nom) + 1})" if noms.count(nom) > 1 else nom for i, nom in enumerate(noms)]
+
+    meta = {
+        "empreinte": empreinte,
+        "n_clusters": len(centres),
+        "centres": centres,
+        "cles": cles,
+        "noms": np.array(noms, dtype=object),
+        "emotions": categories,
+        "codes_emotions": np.array([categories.index(LEGENDES_EMOTIONS[cle]) for cle in emotions.tolist()],
+                                   dtype=np.int8),
+        "caracteristiques": np.select(
+            [centres[:, 1] > 15, centres[:, 1] < 5],
+            ["✓ Hautes notes avec temps modéré", "⨻ Basses notes avec temps court"],
+            default="– Notes moyennes avec temps variable",
+        ).astype(object),
+    }
+    for valeurs in meta.values():
+        if isinstance(valeurs, np.ndarray):
+            valeurs.flags.writeable = False
+    with _verrou_predictions:
+        _metadonnees[empreinte] = meta
+    return meta
+
+def predire_clusters(X, model, scaler):
+    # Clusters 1..K en int8 (numérotés d'après les centroïdes, voir metadonnees_modele),
+    # recalculés seulement si les données ou le modèle changent
+    cle = (hashlib.blake2b(X.tobytes(), digest_size=16).hexdigest(), X.shape, empreinte_modele(model, scaler))
+    with _verrou_predictions:
+        clusters = _predictions.get(cle)
+        if clusters is not None:
+            _predictions.move_to_end(cle)
+            return clusters
+
+    clusters = metadonnees_modele(model, scaler)["cles"][model.predict(scaler.transform(X))]
+    clusters.flags.writeable = False
+    with _verrou_predictions:
+        _predictions[cle] = clusters
+        while len(_predictions) > TAILLE_CACHE_PREDICTIONS:
+            _predictions.popitem(last=False)
+    return clusters
+
+def appliquer_clustering(df, model, scaler, clusters=None):
+    # Ajoute les colonnes Cluster (1..K, int8) et Émotion (catégorielle, lue dans un tableau de K codes).
+    # clusters : prédictions déjà connues pour ces lignes (voir partiels_clusters)
+    meta = metadonnees_modele(model, scaler)
+    if clusters is None:
+        X = df[["Temps utilisé (min)", "Note/20,00"]].to_numpy(dtype=float)
+        clusters = predire_clusters(X, model, scaler)
+    df["Cluster"] = clusters
+    df["Émotion"] = pd.Categorical.from_codes(meta["codes_emotions"][clusters - 1], categories=meta["emotions"])
+    return df
+
+def figure_clusters(df, agrege=None):
+    import plotly.express as px
+    if agrege is None:
+        agrege = grand_jeu(df)
+    if agrege:
+        return figure_clusters_agregee(df)
+    return px.scatter(df, x="Temps utilisé (min)", y="Note/20,00", color="Émotion", symbol="Filière",
+                      title="Clustering des Étudiants selon l'Émotion", hover_data=["Nom Complet"],
+                      color_discrete_map=COULEURS_CLUSTERS)
+
+def figure_clusters_agregee(df, cases=CASES_NUAGE):
+    # Nuage regroupé sur une grille temps × note, par émotion, tracé en WebGL : au plus
+    # cases² points par émotion, la taille du point indique le nombre d'étudiants
+    import plotly.express as px
+    temps = df["Temps utilisé (min)"].to_numpy(dtype=float)
+    notes = df["Note/20,00"].to_numpy(dtype=float)
+    emotions = pd.Categorical(df["Émotion"])
+
+    bornes = []
+    cellules = []
+    for valeurs in (temps, notes):
+        debut, fin = np.nanmin(valeurs), np.nanmax(valeurs)
+        pas = (fin - debut) / cases or 1.0
+        bornes.append((debut, pas))
+        cellules.append(np.clip(((valeurs - debut) / pas).astype(np.int64), 0, cases - 1))
+
+    cles = (emotions.codes.astype(np.int64) * cases + cellules[0]) * cases + cellules[1]
+    comptes = np.bincount(cles[emotions.codes >= 0], minlength=len(emotions.categories) * cases * cases)
+    occupees = np.flatnonzero(comptes)
+    code, reste = np.divmod(occupees, cases * cases)
+    case_temps, case_note = np.divmod(reste, cases)
+
+    agregat = pd.DataFrame({
+        "Temps utilisé (min)": bornes[0][0] + (case_temps + 0.5) * bornes[0][1],
+        "Note/20,00": bornes[1][0] + (case_note + 0.5) * bornes[1][1],
+        "Émotion": emotions.categories[code],
+        "Étudiants": comptes[occupees],
+    })
+    fig = px.scatter(agregat, x="Temps utilisé (min)", y="Note/20,00", color="Émotion", size="Étudiants",
+                     title="Clustering des Étudiants selon l'Émotion", render_mode="webgl",
+                     color_discrete_map=COULEURS_CLUSTERS, size_max=7)
+    fig.update_traces(marker_line_width=0)
+    return fig
+
+def profil_clusters(df, meta=None):
+    # Créer un tableau de résumé pour les clusters (une seule agrégation). Avec les métadonnées
+    # du modèle, nom et caractéristique viennent des centroïdes ; sinon des moyennes observées
+    stats = df.groupby("Cluster").agg(
+        nb_etudiants=("Note/20,00", "size"),
+        note_moy=("Note/20,00", "mean"),
+        temps_moy=("Temps utilisé (min)", "mean"),
+    )
+    return _table_profil(stats, meta)
+
+def _table_profil(stats, meta):
+    # stats : nb_etudiants, note_moy, temps_moy indexés par numéro de cluster (1..K)
+    if meta is not None:
+        positions = stats.index.to_numpy() - 1
+        noms = meta["noms"][positions]
+        caractere = meta["caracteristiques"][positions]
+    else:
+        noms = stats.index.map(LEGENDES_EMOTIONS)
+        caractere = np.select(
+            [stats["note_moy"] > 15, stats["note_moy"] < 5],
+            ["✓ Hautes notes avec temps modéré", "⨻ Basses notes avec temps court"],
+            default="– Notes moyennes avec temps variable",
+        )
+
+    return pd.DataFrame({
+        "Nom du groupe": noms,
+        "Nombre d'étudiants": stats["nb_etudiants"].to_numpy(),
+        "Note moyenne": stats["note_moy"].round(2).to_numpy(),
+        "Temps moyen (min)": stats["temps_moy"].round(2).to_numpy(),
+        "Caractéristique principale": caractere,
+    })
+
+# --- Filtrage par filière : index et agrégats partiels, calculés une fois par jeu de données ---
+def index_filieres(df, question_cols=None):
+    # Par filière (code de la colonne catégorielle) : positions des lignes, effectif et sommes
+    # des questions, de la note et du temps. Une sélection de filières se calcule ensuite en
+    # additionnant ces partiels, sans reparcourir ni copier le tableau complet
+    filiere = df["Filière"]
+    if isinstance(filiere.dtype, pd.CategoricalDtype):
+        codes, categories = filiere.cat.codes.to_numpy(), filiere.cat.categories
+    else:
+        codes, categories = pd.factorize(filiere)
+    codes = codes.astype(np.intp)
+    if question_cols is None:
+        question_cols = [col for col in df.columns if col.startswith("Q.")]
+    colonnes = question_cols + [col for col in ["Note/20,00", "Temps utilisé (min)"] if col in df.columns]
+
+    # Lignes sans filière (code -1) exclues de toute sélection, comme avec isin
+    valides = np.flatnonzero(codes >= 0)
+    ordre = valides[np.argsort(codes[valides], kind="stable")]
+    bornes = np.searchsorted(codes[ordre], np.arange(len(categories) + 1))
+    positions = [ordre[bornes[i]:bornes[i + 1]] for i in range(len(categories))]
+
+    codes_valides = codes[valides]
+    effectifs = np.bincount(codes_valides, minlength=len(categories))
+    sommes = {col: np.bincount(codes_valides, weights=df[col].to_numpy(dtype=float)[valides],
+                               minlength=len(categories))
+              for col in colonnes}
+    # Filières présentes, dans leur ordre d'apparition (comme df["Filière"].unique())
+    presentes = pd.unique(codes_valides)
+    return {
+        "filieres": categories[presentes].tolist(),
+        "presentes": frozenset(presentes.tolist()),
+        # Toutes les lignes ont une filière : tout sélectionner revient à ne pas filtrer
+        "complet": len(valides) == len(codes),
+        "codes": codes,
+        "code": {filiere: code for code, filiere in enumerate(categories)},
+        "positions": positions,
+        "effectifs": pd.Series(effectifs, index=categories),
+        "sommes": pd.DataFrame(sommes, index=categories),
+    }
+
+def codes_selection(index, selection):
+    return np.array([index["code"][filiere] for filiere in selection if filiere in index["code"]], dtype=np.intp)
+
+def positions_selection(index, selection):
+    # Positions (iloc) des lignes des filières choisies, dans l'ordre d'origine ; None : toutes les lignes
+    codes = codes_selection(index, selection)
+    if index["complet"] and index["presentes"] <= set(codes.tolist()):
+        return None
+    if not len(codes):
+        return np.array([], dtype=np.intp)
+    return np.sort(np.concatenate([index["positions"][code] for code in codes]))
+
+def moyennes_selection(index, selection, colonnes):
+    # Moyenne de chaque colonne sur les filières choisies, à partir des sommes partielles
+    codes = codes_selection(index, selection)
+    return index["sommes"].iloc[codes][colonnes].sum() / index["effectifs"].iloc[codes].sum()
+
+def moyennes_partielles(index, colonnes):
+    # Comme moyennes_par_filiere, à partir des sommes partielles (filières présentes)
+    return index["sommes"][colonnes].div(index["effectifs"], axis=0).loc[index["filieres"]]
+
+def partiels_clusters(df, index, model, scaler):
+    # Cluster de chaque ligne et, par filière × cluster, effectif et sommes des notes et des temps
+    X = df[["Temps utilisé (min)", "Note/20,00"]].to_numpy(dtype=float)
+    clusters = predire_clusters(X, model, scaler)
+    k = metadonnees_modele(model, scaler)["n_clusters"]
+    valides = index["codes"] >= 0
+    cles = index["codes"][valides] * k + (clusters[valides].astype(np.intp) - 1)
+    taille = len(index["positions"]) * k
+    return {
+        "clusters": clusters,
+        "effectifs": np.bincount(cles, minlength=taille).reshape(-1, k),
+        "notes": np.bincount(cles, weights=X[valides, 1], minlength=taille).reshape(-1, k),
+        "temps": np.bincount(cles, weights=X[valides, 0], minlength=taille).reshape(-1, k),
+    }
+
+def profil_selection(partiels, index, selection, meta=None):
+    # Même tableau que profil_clusters sur les filières choisies, sans regroupement des lignes
+    codes = codes_selection(index, selection)
+    effectifs = partiels["effectifs"][codes].sum(axis=0)
+    presents = np.flatnonzero(effectifs)
+    stats = pd.DataFrame({
+        "nb_etudiants": effectifs[presents],
+        "note_moy": partiels["notes"][codes].sum(axis=0)[presents] / effectifs[presents],
+        "temps_moy": partiels["temps"][codes].sum(axis=0)[presents] / effectifs[presents],
+    }, index=presents + 1)
+    return _table_profil(stats, meta)
+
+def index_etudiants(df):
+    # Position (iloc) de la première ligne de chaque étudiant, calculée une fois par jeu de données
+    premiers = ~df["Nom Complet"].duplicated().to_numpy()
+    return dict(zip(df["Nom Complet"].to_numpy()[premiers].tolist(), np.flatnonzero(premiers).tolist()))
+
+def moyennes_par_filiere(df, question_cols):
+    # Moyenne de chaque question par filière, calculée une seule fois pour tous les étudiants
+    return df.groupby("Filière", observed=True)[question_cols].mean()
+
+def figure_comparaison(nom, filiere, scores, moyennes, question_cols):
+    import plotly.express as px
+    compare_df = pd.DataFrame({
+        "Question": question_cols,
+        "Score Étudiant": scores,
+        "Moyenne Filière": moyennes,
+    })
+    return px.bar(compare_df, x="Question", y=["Score Étudiant", "Moyenne Filière"],
+                  barmode="group", title=f"Comparaison {nom} vs Moyenne {filiere}",
+                  labels={"value": "Score (0 = Faux, 1 = Correct)", "variable": "Type de Score"})
+
+def generer_rapport(df, chemin_sortie, chemin_modele="clustering_model.pkl", anonymise=True, timings=None):
+    # Analyse complète d'un jeu de données nettoyé et écriture du PDF (même ordre que l'application)
+    import pdf_generator as pg
+    timings = {} if timings is None else timings
+    model, scaler = charger_modele(chemin_modele)
+
+    if anonymise:
+        with etape(timings, "anonymisation"):
+            df = anonymiser(df)
+
+    with etape(timings, "graphiques"):
+        question_cols = [col for col in df.columns if col.startswith("Q.")]
+        fig1 = figure_notes(df)
+        fig2 = figure_reussite(df, question_cols)
+
+    with etape(timings, "top"):
+        top_students_dict = get_top_students(df, n=5)
+
+    fig3 = profil_df = None
+    if "Temps utilisé (min)" in df.columns and "Note/20,00" in df.columns:
+        with etape(timings, "clustering"):
+            df = appliquer_clustering(df, model, scaler)
+        with etape(timings, "graphiques"):
+            fig3 = figure_clusters(df)
+        with etape(timings, "profil"):
+            df = df.reset_index(drop=True)
+            profil_df = profil_clusters(df, metadonnees_modele(model, scaler))
+
+    with etape(timings, "pdf"):
+        pdf_path = pg.generer_pdf(df, fig1, fig2, fig3=fig3, profil_df=profil_df, top_students_dict=top_students_dict)
+        shutil.move(pdf_path, chemin_sortie)
+    return timings
+
+# --- Traitement par lots ---
+def nom_fichier(nom):
+    return re.sub(r"[^\w.-]+", "_", str(nom)).strip("_")
+
+def nom_rapport(nom):
+    return "rapport_" + nom_fichier(nom) + ".pdf"
+
+# --- Rapports individuels ---
+ETUDIANTS_PAR_TACHE = 50
+
+def _rapports_etudiants(etudiants, scores, question_cols, moyennes):
+    # Un lot d'étudiants (exécuté dans un processus du pool) : renvoie les PDF en bytes
+    import pdf_generator as pg
+    pdfs = []
+    for (nom, filiere, note, temps, emotion), scores_etudiant in zip(etudiants, scores):
+        infos = [("Filière", filiere), ("Note", f"{note:.2f}/20")]
+        if temps is not None:
+            infos.append(("Temps utilisé", f"{temps:.2f} min"))
+        profil = None
+        if emotion is not None:
+            infos.append(("État émotionnel", emotion))
+            p = PROFILS_EMOTIONS.get(emotion)
+            if p is not None:
+                profil = (p["titre"], p["resume"], [c.format(note=note) for c in p["constats"]],
+                          p["recommandations"])
+        pdfs.append(pg.generer_pdf_etudiant(nom, infos, question_cols, scores_etudiant,
+                                            moyennes.get(filiere), profil))
+    return pdfs
+
+def _valeurs(df, colonne):
+    # Valeurs Python d'une colonne optionnelle (None si absente ou manquante)
+    if colonne not in df.columns:
+        return [None] * len(df)
+    return df[colonne].astype(object).where(df[colonne].notna(), None).tolist()
+
+def generer_rapports_etudiants(df, chemin_zip, filieres=None, workers=None, progression=None):
+    # Un PDF par étudiant (éventuellement limité à certaines filières), rassemblés dans un ZIP.
+    # progression(faits, total) est appelée à chaque lot terminé. Renvoie le nombre de rapports
+    if filieres is not None:
+        df = df[df["Filière"].isin(filieres)]
+    question_cols = [col for col in df.columns if col.startswith("Q.")]
+    table = moyennes_par_filiere(df, question_cols)
+    moyennes = dict(zip(table.index.astype(str), table.to_numpy(dtype=float).tolist()))
+
+    n = len(df)
+    etudiants = list(zip(df["Nom Complet"].astype(str).tolist(), df["Filière"].astype(str).tolist(),
+                         df["Note/20,00"].astype(float).tolist(), _valeurs(df, "Temps utilisé (min)"),
+                         _valeurs(df, "Émotion")))
+    scores = np.nan_to_num(df[question_cols].to_numpy(dtype=float)).tolist()
+
+    # Noms des fichiers dans l'archive : un dossier par filière, suffixe si deux étudiants ont le même nom
+    noms = []
+    vus = set()
+    for nom, filiere, *_ in etudiants:
+        chemin = f"{nom_fichier(filiere)}/{nom_rapport(nom)}"
+        k = 2
+        while chemin in vus:
+            chemin = f"{nom_fichier(filiere)}/{nom_rapport(f'{nom}_{k}')}"
+            k += 1
+        vus.add(chemin)
+        noms.append(chemin)
+
+    workers = nombre_workers() if workers is None else workers
+    faits = 0
+    with zipfile.ZipFile(chemin_zip, "w", zipfile.ZIP_STORED) as archive, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        taches = {}
+        for debut in range(0, n, ETUDIANTS_PAR_TACHE):
+            fin = min(debut + ETUDIANTS_PAR_TACHE, n)
+            lot = etudiants[debut:fin]
+            moyennes_lot = {filiere: moyennes[filiere] for filiere in {e[1] for e in lot}}
+            taches[executor.submit(_rapports_etudiants, lot, scores[debut:fin], question_cols, moyennes_lot)] = debut
+
+        for future in as_completed(taches):
+            debut = taches[future]
+            # Les PDF sont déjà compressés : stockés tels quels dans l'archive
+            for nom, pdf in zip(noms[debut:], future.result()):
+                archive.writestr(nom, pdf)
+            faits += ETUDIANTS_PAR_TACHE
+            if progression is not None:
+                progression(min(faits, n), n)
+    return n
+
+def _rapport_fichier(chemin, dossier_sortie, chemin_modele, anonymise):
+    # Un rapport par fichier (exécuté dans un processus du pool)
+    timings = {}
+    nom = os.path.basename(chemin)
+    with etape(timings, "lecture"):
+        with open(chemin, "rb") as f:
+            df = lire_fichier(f.read(), nom)
+    with etape(timings, "nettoyage"):
+        df = nettoyer_donnees(df)
+    sortie = os.path.join(dossier_sortie, nom_rapport(os.path.splitext(nom)[0]))
+    generer_rapport(df, sortie, chemin_modele, anonymise, timings)
+    return sortie, len(df), timings
+
+def _rapport_filiere(filiere, df, dossier_sortie, chemin_modele, anonymise):
+    # Un rapport par filière (exécuté dans un processus du pool)
+    sortie = os.path.join(dossier_sortie, nom_rapport(filiere))
+    timings = generer_rapport(df, sortie, chemin_modele, anonymise)
+    return sortie, len(df), timings
+
+def lister_exports(dossier):
+    return sorted(os.path.join(dossier, nom) for nom in os.listdir(dossier)
+                  if nom.endswith((".xlsx", ".csv")) and not nom.startswith("~$"))
+
+def _lire_exports(executor, chemins):
+    # Lecture et nettoyage des exports dans le pool, puis fusion
+    # Un fichier illisible est signalé et ignoré. Renvoie (df, nombre de fichiers lus)
+    debut = time.perf_counter()
+    taches = []
+    for chemin in chemins:
+        nom = os.path.basename(chemin)
+        with open(chemin, "rb") as f:
+            taches.append((nom, executor.submit(traiter_fichier, f.read(), nom)))
+    df_list = []
+    for nom, future in taches:
+        try:
+            df_list.append(future.result())
+        except Exception as e:
+            print(f"{nom} : erreur : {e}")
+    df = fusionner_donnees(df_list) if df_list else pd.DataFrame()
+    print(f"Lecture et nettoyage de {len(df_list)}/{len(chemins)} fichiers : {time.perf_counter() - debut:.2f} s")
+    return df, len(df_list)
+
+def traiter_lot(dossier, dossier_sortie, par="filiere", workers=None, chemin_modele="clustering_model.pkl",
+                anonymise=True):
+    # Génère les rapports d'un dossier d'exports en parallèle et affiche les temps par étape.
+    # Renvoie False si aucun des fichiers du dossier n'a pu être traité
+    os.makedirs(dossier_sortie, exist_ok=True)
+    chemins = lister_exports(dossier)
+    workers = nombre_workers() if workers is None else workers
+
+    if par == "etudiant":
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            df, lus = _lire_exports(executor, chemins)
+        if not len(df):
+            return lus > 0 or not chemins
+        if anonymise:
+            df = anonymiser(df)
+        if "Temps utilisé (min)" in df.columns:
+            df = appliquer_clustering(df, *charger_modele(chemin_modele))
+        debut = time.perf_counter()
+        sortie = os.path.join(dossier_sortie, "rapports_etudiants.zip")
+        n = generer_rapports_etudiants(
+            df, sortie, workers=workers,
+            progression=lambda faits, total: print(f"\r{faits}/{total} rapports", end="", flush=True))
+        print(f"\n{n} rapports individuels -> {sortie} | {time.perf_counter() - debut:.2f} s")
+        return True
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if par == "fichier":
+            taches = {executor.submit(_rapport_fichier, chemin, dossier_sortie, chemin_modele, anonymise):
+                      os.path.basename(chemin) for chemin in chemins}
+            lus = 0
+        else:
+            df, lus = _lire_exports(executor, chemins)
+            taches = {executor.submit(_rapport_filiere, filiere, groupe, dossier_sortie, chemin_modele, anonymise):
+                      filiere for filiere, groupe in df.groupby("Filière", observed=True)} if len(df) else {}
+
+        for future, nom in taches.items():
+            try:
+                sortie, lignes, timings = future.result()
+            except Exception as e:
+                print(f"{nom} : erreur : {e}")
+                continue
+            if par == "fichier":
+                lus += 1
+            detail = ", ".join(f"{etape_} {duree:.2f} s" for etape_, duree in timings.items())
+            print(f"{nom} ({lignes} étudiants) -> {sortie} | {detail}")
+    return lus > 0 or not chemins
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Génération des rapports Émotionnella sans Streamlit")
+    parser.add_argument("dossier", help="Dossier contenant les exports .xlsx/.csv")
+    parser.add_argument("-o", "--sortie", default="rapports", help="Dossier des rapports PDF")
+    parser.add_argument("--par", choices=["filiere", "fichier", "etudiant"], default="filiere",
+                        help="Un rapport par filière, par fichier ou par étudiant (archive ZIP)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--modele", default=None, help="Modèle à utiliser (par défaut la dernière version)")
+    parser.add_argument("--noms-complets", action="store_true", help="Ne pas anonymiser les noms")
+    args = parser.parse_args()
+
+    debut = time.perf_counter()
+    reussi = traiter_lot(args.dossier, args.sortie, args.par, args.workers, args.modele or dernier_modele(),
+                         not args.noms_complets)
+    print(f"Total : {time.perf_counter() - debut:.2f} s")
+    if not reussi:
+        sys.exit(1)